@@ -1,27 +1,43 @@
 """
 Vercel API handler for FastAPI backend
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from typing import Annotated, List, Any, Mapping, Optional, Sequence, Tuple
+from contextlib import asynccontextmanager
+import msgspec
 import os
+import re
+import asyncio
+import time
 import logging
+from functools import lru_cache
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timezone
 
-# Load environment variables
-load_dotenv()
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging - production keeps warnings only and skips per-request access logs
+IS_PRODUCTION = os.getenv("VERCEL_ENV") == "production"
+logging.basicConfig(level=logging.WARNING if IS_PRODUCTION else logging.INFO)
 logger = logging.getLogger(__name__)
+if IS_PRODUCTION:
+    logging.getLogger("uvicorn.access").disabled = True
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    """Close the Postgres pool on shutdown so recycled instances don't leak connections"""
+    yield
+    # Only close a manager that was actually built; building one just to close it is wasted work
+    if get_supabase.cache_info().currsize:
+        await get_supabase().close()
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Simple Text-to-Query API",
     description="Convert natural language to SQL queries and execute on Supabase",
-    version="2.0.0"
+    version="2.0.0",
+    default_response_class=ORJSONResponse,
+    lifespan=_lifespan
 )
 
 # CORS middleware - Updated for Vercel deployment
@@ -37,44 +53,256 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Import backend modules
-try:
-    from gemini_sql import GeminiTextToSQL
-    from supabase_manager import SupabaseManager
-except ImportError as e:
-    logger.error(f"Failed to import backend modules: {e}")
-    # Create dummy classes for now
-    class GeminiTextToSQL:
-        def generate_sql(self, query): return f"SELECT 'Error importing GeminiTextToSQL' as message"
-        def explain_sql(self, sql): return "Module import failed"
-    
-    class SupabaseManager:
-        async def execute_sql_query(self, sql, limit): 
-            return [{"error": "Failed to import SupabaseManager", "message": "Check backend dependencies"}]
+# Backend services are imported and built on first use to keep cold starts cheap
+class _UnavailableGemini:
+    """Stand-in used when gemini_sql cannot be imported"""
+    def generate_sql(self, query): return "SELECT 'Error importing GeminiTextToSQL' as message"
+    def generate_sql_batch(self, queries): return [self.generate_sql(query) for query in queries]
+    def explain_sql(self, sql): return "Module import failed"
 
-# Initialize services
-supabase_manager = SupabaseManager()
-gemini_sql = GeminiTextToSQL()
+class _UnavailableSupabase:
+    """Stand-in used when supabase_manager cannot be imported"""
+    async def execute_sql_query(self, sql, limit): 
+        return [{"error": "Failed to import SupabaseManager", "message": "Check backend dependencies"}]
+    async def iter_sql_query(self, sql, limit):
+        for row in await self.execute_sql_query(sql, limit):
+            yield row
+    def split_sql(self, sql): return [sql]
+    async def close(self): pass
+
+@lru_cache(maxsize=1)
+def get_gemini():
+    """Return the shared Gemini text-to-SQL service"""
+    load_dotenv()
+    try:
+        from gemini_sql import GeminiTextToSQL
+    except ImportError as e:
+        logger.error(f"Failed to import backend modules: {e}")
+        return _UnavailableGemini()
+    return GeminiTextToSQL()
+
+@lru_cache(maxsize=1)
+def get_supabase():
+    """Return the shared Supabase manager"""
+    load_dotenv()
+    try:
+        from supabase_manager import get_supabase_manager
+    except ImportError as e:
+        logger.error(f"Failed to import backend modules: {e}")
+        return _UnavailableSupabase()
+    return get_supabase_manager()
 
-# Pydantic models
-class SimpleQueryRequest(BaseModel):
+# Request/response models
+class SimpleQueryRequest(msgspec.Struct, frozen=True):
     """Simple query request"""
-    query: str = Field(..., description="Natural language query")
-    max_results: int = Field(default=10, description="Maximum results to return")
-    explain: bool = Field(default=True, description="Include AI explanation of the SQL")
+    query: Annotated[str, msgspec.Meta(description="Natural language query")]
+    max_results: Annotated[int, msgspec.Meta(description="Maximum results to return")] = 10
+    explain: Annotated[bool, msgspec.Meta(description="Include AI explanation of the SQL")] = True
 
-class SimpleQueryResponse(BaseModel):
+class SubqueryResult(msgspec.Struct, frozen=True):
+    """One statement of a compound query and how many of the response's rows it produced"""
+    sql: str
+    row_count: int
+
+class SimpleQueryResponse(msgspec.Struct, frozen=True, kw_only=True, omit_defaults=True):
     """Simple query response"""
     success: bool
     query: str
-    generated_sql: str = ""
-    results: List[Dict[str, Any]]
+    generated_sql: str
+    results: List[Mapping[str, Any]]
     explanation: Optional[str] = None
     execution_time: float
     row_count: int
     error: Optional[str] = None
+    # Set for compound SQL: its statements in order, results holding their rows back to back
+    subqueries: Optional[List[SubqueryResult]] = None
+
+# Row types encoded as JSON objects: read-only mappings (cached rows, mock fixtures) and asyncpg
+# records, which expose items() without being a Mapping
+try:
+    from asyncpg import Record
+    _ROW_TYPES: Tuple[type, ...] = (Mapping, Record)
+except ImportError:
+    _ROW_TYPES = (Mapping,)
+
+def _enc_hook(obj: Any) -> Any:
+    """Encode result rows that msgspec can't serialize natively as plain objects"""
+    if isinstance(obj, _ROW_TYPES):
+        return dict(obj.items())
+    raise NotImplementedError(f"Objects of type {type(obj)} are not supported")
+
+# Postgres numeric values reach the pool path as Decimal; encode them as JSON numbers like PostgREST does
+_json_encoder = msgspec.json.Encoder(enc_hook=_enc_hook, decimal_format="number")
+
+# msgspec models are not visible to FastAPI, so describe them in the OpenAPI schema by hand
+_, _schemas = msgspec.json.schema_components([SimpleQueryRequest, SimpleQueryResponse])
+# Nested structs are referenced under $defs, which FastAPI's document doesn't carry, so inline them
+_schemas["SimpleQueryResponse"]["properties"]["subqueries"]["anyOf"][0]["items"] = _schemas["SubqueryResult"]
+_QUERY_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": _schemas["SimpleQueryRequest"]}}
+    },
+    "responses": {
+        "200": {
+            "description": "Successful Response",
+            "content": {"application/json": {"schema": _schemas["SimpleQueryResponse"]}}
+        }
+    }
+}
+
+# Keyword fallback used when Gemini cannot produce SQL (quota outages etc.).
+# Rules are checked in order against the question's word set, first match wins.
+_COUNT_CUSTOMERS_SQL = "SELECT COUNT(*) FROM customers"
+_COUNT_ORDERS_SQL = "SELECT COUNT(*) FROM orders"
+_TOP_CUSTOMERS_SQL = "SELECT name, company, revenue FROM customers ORDER BY revenue DESC LIMIT 10"
+
+_FALLBACK_RULES = (
+    (frozenset({"count", "customer"}), _COUNT_CUSTOMERS_SQL),
+    (frozenset({"how", "many", "customer"}), _COUNT_CUSTOMERS_SQL),
+    (frozenset({"number", "customer"}), _COUNT_CUSTOMERS_SQL),
+    (frozenset({"count", "order"}), _COUNT_ORDERS_SQL),
+    (frozenset({"how", "many", "order"}), _COUNT_ORDERS_SQL),
+    (frozenset({"number", "order"}), _COUNT_ORDERS_SQL),
+    (frozenset({"top", "customer"}), _TOP_CUSTOMERS_SQL),
+    (frozenset({"best", "customer"}), _TOP_CUSTOMERS_SQL),
+    (frozenset({"biggest", "customer"}), _TOP_CUSTOMERS_SQL),
+    (frozenset({"high", "customer"}), _TOP_CUSTOMERS_SQL),
+    (frozenset({"highest", "customer"}), _TOP_CUSTOMERS_SQL),
+    (frozenset({"revenue", "customer"}), _TOP_CUSTOMERS_SQL),
+    (frozenset({"this", "month", "order"}), "SELECT * FROM orders WHERE order_date >= date_trunc('month', current_date)"),
+    (frozenset({"order"}), "SELECT * FROM orders"),
+    (frozenset({"customer"}), "SELECT * FROM customers"),
+)
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_WORD_ALIASES = {"customers": "customer", "orders": "order"}
+
+def _get_fallback_sql(query: str) -> Optional[str]:
+    """Match the question's words against the keyword rules and return canned SQL, if any"""
+    tokens = frozenset(_WORD_ALIASES.get(word, word) for word in _WORD_RE.findall(query.lower()))
+    for required, sql in _FALLBACK_RULES:
+        if required <= tokens:
+            return sql
+    return None
 
 # Helper Functions
+class SQLBatchLoader:
+    """
+    Coalesces concurrent SQL generation requests into batched Gemini calls
+    Questions arriving within batch_window seconds share one round-trip
+    """
+    
+    def __init__(self, batch_fn, max_batch_size: int = 16, batch_window: float = 0.01):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self._pending = []
+        self._flush_handle = None
+        self._tasks = set()
+    
+    async def load(self, question: str) -> str:
+        """Queue a question and wait for its generated SQL"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((question, future))
+        
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.batch_window, self._flush)
+        
+        return await future
+    
+    def _flush(self):
+        """Dispatch everything queued so far as one batch"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._dispatch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+    
+    async def _dispatch(self, batch):
+        """Run the blocking batch call in a thread and resolve each caller"""
+        try:
+            sqls = await asyncio.to_thread(self.batch_fn, [question for question, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), sql in zip(batch, sqls):
+            if not future.done():
+                future.set_result(sql)
+
+_gemini_loader = SQLBatchLoader(lambda questions: get_gemini().generate_sql_batch(questions))
+
+def _ok(query: str, generated_sql: str, results: Sequence[Mapping[str, Any]],
+        execution_time: float, explanation: Optional[str] = None,
+        subqueries: Optional[List[SubqueryResult]] = None) -> SimpleQueryResponse:
+    """Build a successful response"""
+    return SimpleQueryResponse(
+        success=True,
+        query=query,
+        generated_sql=generated_sql,
+        results=results,
+        explanation=explanation,
+        execution_time=execution_time,
+        row_count=len(results),
+        error=None,
+        subqueries=subqueries
+    )
+
+def _err(query: str, error: str, execution_time: float, generated_sql: str = "") -> SimpleQueryResponse:
+    """Build a failed response"""
+    return SimpleQueryResponse(
+        success=False,
+        query=query,
+        generated_sql=generated_sql,
+        results=[],
+        explanation=None,
+        execution_time=execution_time,
+        row_count=0,
+        error=error
+    )
+
+async def _execute(sql: str, max_results: int) -> Tuple[Sequence[Mapping[str, Any]], Optional[List[SubqueryResult]]]:
+    """
+    Run generated SQL on Supabase, one statement at a time when it is compound
+    Returns the rows and, for compound SQL, each statement with its share of them
+    """
+    supabase = get_supabase()
+    statements = supabase.split_sql(sql)
+    if len(statements) == 1:
+        return await supabase.execute_sql_query(sql, max_results), None
+    
+    # Independent statements run concurrently, each with its own max_results
+    parts = await asyncio.gather(*(supabase.execute_sql_query(statement, max_results) for statement in statements))
+    results = [row for rows in parts for row in rows]
+    return results, [SubqueryResult(sql=statement, row_count=len(rows)) for statement, rows in zip(statements, parts)]
+
+async def _explain(sql: str) -> str:
+    """Generate the AI explanation off the event loop"""
+    try:
+        return await asyncio.to_thread(get_gemini().explain_sql, sql)
+    except:
+        return "AI explanation temporarily unavailable"
+
+def _respond(response: SimpleQueryResponse) -> Response:
+    """Encode a query response with msgspec, omitting empty optional fields"""
+    return Response(content=_json_encoder.encode(response), media_type="application/json")
+
+async def _parse_query_request(request: Request) -> SimpleQueryRequest:
+    """Decode and validate the request body with msgspec"""
+    try:
+        return msgspec.json.decode(await request.body(), type=SimpleQueryRequest)
+    except msgspec.DecodeError as e:
+        raise HTTPException(status_code=422, detail=str(e))
 
 # API Endpoints
 @app.get("/")
@@ -82,7 +310,7 @@ async def root():
     """Root endpoint"""
     return {
         "message": "Text-to-Query API is running",
-        "endpoints": ["/health", "/query", "/simple-query"],
+        "endpoints": ["/health", "/query", "/query/stream", "/simple-query"],
         "version": "2.0.0",
         "status": "active"
     }
@@ -92,85 +320,127 @@ async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
         "service": "simple-text-to-query"
     }
 
-async def process_text_query(request: SimpleQueryRequest) -> SimpleQueryResponse:
+async def _resolve_sql(query: str) -> Tuple[str, bool, bool]:
+    """
+    Generate SQL for a question, trying the keyword fallback if Gemini fails
+    Returns (sql, is_valid, used_fallback); invalid SQL carries Gemini's error text
+    """
+    logger.info(f"Processing query: {query}")
+    generated_sql = await _gemini_loader.load(query)
+    logger.info(f"Generated SQL using Gemini: {generated_sql}")
+
+    if generated_sql and "ERROR:" not in generated_sql and "Failed to generate" not in generated_sql:
+        return generated_sql, True, False
+
+    # Only fall back when Gemini itself failed (quota, outage); a refusal such as
+    # "ERROR: Cannot generate SQL for this question" stays an error
+    if "Failed to generate" not in (generated_sql or ""):
+        return generated_sql, False, False
+
+    fallback_sql = _get_fallback_sql(query)
+    if fallback_sql is None:
+        return generated_sql, False, False
+    logger.warning(f"Gemini unavailable, using fallback SQL: {fallback_sql}")
+    return fallback_sql, True, True
+
+async def process_text_query(request: SimpleQueryRequest) -> Response:
     """
     Process text-to-query logic for both endpoints
     """
-    start_time = datetime.now()
+    start_time = time.perf_counter()
     
     try:
-        logger.info(f"Processing query: {request.query}")
-        generated_sql = gemini_sql.generate_sql(request.query)
-        logger.info(f"Generated SQL using Gemini: {generated_sql}")
-
         # If Gemini fails to generate a valid SQL, return error
-        if not generated_sql or "ERROR:" in generated_sql or "Failed to generate" in generated_sql:
-            return SimpleQueryResponse(
-                success=False,
-                query=request.query,
-                generated_sql=generated_sql,
-                results=[],
-                execution_time=(datetime.now() - start_time).total_seconds(),
-                row_count=0,
-                error="Gemini could not generate a valid SQL for this query."
-            )
+        generated_sql, is_valid, used_fallback = await _resolve_sql(request.query)
+        if not is_valid:
+            return _respond(_err(
+                request.query,
+                "Gemini could not generate a valid SQL for this query.",
+                time.perf_counter() - start_time,
+                generated_sql=generated_sql
+            ))
 
-        # Execute the query directly on Supabase
-        results = await supabase_manager.execute_sql_query(generated_sql, request.max_results)
-        execution_time = (datetime.now() - start_time).total_seconds()
-
-        response = SimpleQueryResponse(
-            success=True,
-            query=request.query,
-            generated_sql=generated_sql,
-            results=results,
-            execution_time=execution_time,
-            row_count=len(results)
-        )
-
-        # Add explanation if requested and AI is available
-        if request.explain:
-            try:
-                explanation = gemini_sql.explain_sql(generated_sql)
-                response.explanation = explanation
-            except:
-                response.explanation = "AI explanation temporarily unavailable"
+        # Execute the query directly on Supabase, explaining it in parallel if requested
+        explanation = None
+        if request.explain and not used_fallback:
+            (results, subqueries), explanation = await asyncio.gather(
+                _execute(generated_sql, request.max_results),
+                _explain(generated_sql)
+            )
+        else:
+            results, subqueries = await _execute(generated_sql, request.max_results)
+            if request.explain:
+                explanation = "Matched a built-in query because the AI service is unavailable"
+        execution_time = time.perf_counter() - start_time
 
         logger.info(f"Query executed successfully - {len(results)} rows in {execution_time:.2f}s")
-        return response
+        return _respond(_ok(request.query, generated_sql, results, execution_time, explanation, subqueries))
 
     except Exception as e:
-        execution_time = (datetime.now() - start_time).total_seconds()
+        execution_time = time.perf_counter() - start_time
         logger.error(f"Query processing failed: {str(e)}")
-        return SimpleQueryResponse(
-            success=False,
-            query=request.query,
-            generated_sql="",
-            results=[],
-            execution_time=execution_time,
-            row_count=0,
-            error=str(e)
-        )
-
-@app.post("/simple-query")
-async def simple_text_to_query(request: SimpleQueryRequest) -> SimpleQueryResponse:
+        return _respond(_err(request.query, str(e), execution_time))
+
+@app.post("/simple-query", openapi_extra=_QUERY_OPENAPI)
+async def simple_text_to_query(request: SimpleQueryRequest = Depends(_parse_query_request)):
     """
     Simple text-to-query endpoint that works directly with Supabase
     No complex configuration required - perfect for testing!
     """
     return await process_text_query(request)
 
-@app.post("/query")
-async def text_to_query(request: SimpleQueryRequest) -> SimpleQueryResponse:
+@app.post("/query", openapi_extra=_QUERY_OPENAPI)
+async def text_to_query(request: SimpleQueryRequest = Depends(_parse_query_request)):
     """
     Text-to-query endpoint for generating SQL from natural language
     and performing Supabase operations
     """
     return await process_text_query(request)
 
+@app.post("/query/stream")
+async def stream_text_to_query(request: SimpleQueryRequest = Depends(_parse_query_request)):
+    """
+    Text-to-query endpoint that streams result rows as newline-delimited JSON
+    The first line carries the query metadata, every following line is one row.
+    Compound SQL lists its statements under "subqueries" in the first line and runs them
+    in order, each one's rows preceded by a {"subquery": index} line
+    """
+    statements = []
+    try:
+        generated_sql, is_valid, _ = await _resolve_sql(request.query)
+        error = None if is_valid else "Gemini could not generate a valid SQL for this query."
+        if is_valid:
+            statements = get_supabase().split_sql(generated_sql)
+    except Exception as e:
+        logger.error(f"Query processing failed: {str(e)}")
+        generated_sql, is_valid, error = "", False, str(e)
+
+    if is_valid:
+        header = {"success": True, "query": request.query, "generated_sql": generated_sql}
+        if len(statements) > 1:
+            header["subqueries"] = statements
+    else:
+        header = {"success": False, "query": request.query, "generated_sql": generated_sql, "error": error}
+
+    async def _rows():
+        yield _json_encoder.encode(header) + b"\n"
+        if not is_valid:
+            return
+        try:
+            for index, statement in enumerate(statements):
+                if len(statements) > 1:
+                    yield _json_encoder.encode({"subquery": index}) + b"\n"
+                async for row in get_supabase().iter_sql_query(statement, request.max_results):
+                    yield _json_encoder.encode(row) + b"\n"
+        except Exception as e:
+            logger.error(f"Streaming query failed: {str(e)}")
+            yield _json_encoder.encode({"error": str(e)}) + b"\n"
+
+    return StreamingResponse(_rows(), media_type="application/x-ndjson")
+
 # This is the handler that Vercel will call
 handler = app
@@ -2,14 +2,105 @@
 Custom text-to-SQL converter using Google Gemini 2.0 Flash directly
 """
 import os
+import re
 import json
-from typing import Dict, Any, List
+import time
+import hashlib
+import threading
+from typing import Dict, Any, List, Optional
 import google.generativeai as genai
+from cachetools import TTLCache
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env.local'))
 
+# Upper bound on in-flight Gemini calls per process
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# Local budget for Gemini calls, sized to the API quota
+GEMINI_REQUESTS_PER_MINUTE = int(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60"))
+
+# Generated SQL cache settings
+SQL_CACHE_MAXSIZE = 1024
+SQL_CACHE_TTL = 3600  # seconds
+
+# Explanation cache settings
+EXPLAIN_CACHE_MAXSIZE = 2048
+EXPLAIN_CACHE_TTL = 86400  # seconds
+
+# Prompt templates, rendered against the context once and then only suffixed per call
+_SQL_PROMPT_PREFIX = """You are an expert SQL query generator. Convert the natural language question to SQL.
+
+{context}
+
+RULES:
+1. Generate only valid SQL queries
+2. Use the exact table and column names from the schema
+3. Return only the SQL query, no explanations
+4. Use proper SQL syntax and best practices
+5. If the question cannot be answered with the given schema, return "ERROR: Cannot generate SQL for this question"
+
+Question: """
+_SQL_PROMPT_SUFFIX = """
+
+SQL Query:"""
+
+_BATCH_PROMPT_PREFIX = """You are an expert SQL query generator. Convert each numbered natural language question to SQL.
+
+{context}
+
+RULES:
+1. Generate only valid SQL queries
+2. Use the exact table and column names from the schema
+3. Return only the SQL queries, no explanations
+4. Use proper SQL syntax and best practices
+5. If a question cannot be answered with the given schema, use "ERROR: Cannot generate SQL for this question" for it
+6. Respond with a JSON array of strings holding exactly one SQL query per question, in order
+
+Questions:
+"""
+_BATCH_PROMPT_SUFFIX = """
+
+JSON array:"""
+
+_EXPLAIN_PROMPT_PREFIX = """Explain this SQL query in simple business terms.
+
+{context}
+
+SQL Query: """
+_EXPLAIN_PROMPT_SUFFIX = """
+
+Explanation:"""
+
+# Markdown code fence (with optional language tag) around a model response
+_FENCE_RE = re.compile(r"^```(?:sql|json)?\s*|\s*```$")
+
+def _question_key(question: str) -> str:
+    """Normalize a question and hash it into a cache key"""
+    return hashlib.blake2b(question.lower().strip().encode()).hexdigest()
+
+class TokenBucket:
+    """Thread-safe token bucket that refuses instead of waiting when empty"""
+    
+    def __init__(self, rate: int, period: float = 60.0):
+        self.capacity = float(rate)
+        self.refill_rate = rate / period
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def try_acquire(self) -> bool:
+        """Take one token if available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_rate)
+            self._updated = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
 class GeminiTextToSQL:
     def __init__(self):
         """Initializing Gemini"""
@@ -17,17 +108,49 @@ class GeminiTextToSQL:
         if not api_key:
             raise ValueError("GEMINI_API_KEY environment variable is required")
         
-        genai.configure(api_key=api_key)
+        # gRPC keeps one long-lived HTTP/2 channel that every call multiplexes over
+        genai.configure(api_key=api_key, transport="grpc")
         self.model = genai.GenerativeModel('gemini-2.0-flash-exp')
+        self._semaphore = threading.BoundedSemaphore(GEMINI_MAX_CONCURRENCY)
+        self._limiter = TokenBucket(GEMINI_REQUESTS_PER_MINUTE)
         
         # Training data storage
         self.schema_info = {}
         self.training_examples = []
         self.business_context = []
+        
+        # Pre-rendered prompt sections, updated as training data is added
+        self._schema_ddl = ""
+        self._business_ctx_str = ""
+        self._examples_str = ""
+        self._context_cache: Optional[str] = None
+        self._prefix_cache: Dict[str, str] = {}
+        
+        # Generated SQL keyed on the normalized question
+        self._sql_cache = TTLCache(maxsize=SQL_CACHE_MAXSIZE, ttl=SQL_CACHE_TTL)
+        # Explanations keyed on whitespace-normalized SQL
+        self._explain_cache = TTLCache(maxsize=EXPLAIN_CACHE_MAXSIZE, ttl=EXPLAIN_CACHE_TTL)
+        self._sql_cache_lock = threading.Lock()
+    
+    def _invalidate_context(self):
+        """Drop the cached prompt context, SQL and explanations once training data changes"""
+        self._context_cache = None
+        self._prefix_cache = {}
+        with self._sql_cache_lock:
+            self._sql_cache.clear()
+            self._explain_cache.clear()
     
     def add_schema(self, schema_data: Dict[str, Any]):
         """Add database schema information"""
         self.schema_info = schema_data
+        ddl_parts = ["DATABASE SCHEMA:\n"] if schema_data else []
+        for table in (schema_data or {}).get('tables', []):
+            columns = table.get('columns', [])
+            if columns:
+                col_defs = ', '.join([f"{col['name']} {col['type']}" for col in columns])
+                ddl_parts.append(f"CREATE TABLE {table.get('name', '')} ({col_defs});\n")
+        self._schema_ddl = "".join(ddl_parts)
+        self._invalidate_context()
     
     def add_training_example(self, question: str, sql: str, explanation: str = ""):
         """Add a training example"""
@@ -36,105 +159,132 @@ class GeminiTextToSQL:
             "sql": sql,
             "explanation": explanation
         })
+        block = f"Question: {question}\nSQL: {sql}\n"
+        if explanation:
+            block += f"Explanation: {explanation}\n"
+        self._examples_str = (self._examples_str + "\n" if self._examples_str else "EXAMPLE QUERIES:\n") + block
+        self._invalidate_context()
     
     def add_business_context(self, context: str):
         """Add business domain knowledge"""
         self.business_context.append(context)
+        if not self._business_ctx_str:
+            self._business_ctx_str = "BUSINESS CONTEXT:\n"
+        self._business_ctx_str += context + "\n"
+        self._invalidate_context()
     
     def _build_context_prompt(self) -> str:
         """Build the context prompt with schema and examples"""
-        context_parts = []
-        
-        # Add schema information
-        if self.schema_info:
-            context_parts.append("DATABASE SCHEMA:")
-            for table in self.schema_info.get('tables', []):
-                table_name = table.get('name', '')
-                columns = table.get('columns', [])
-                if columns:
-                    col_defs = ', '.join([f"{col['name']} {col['type']}" for col in columns])
-                    context_parts.append(f"CREATE TABLE {table_name} ({col_defs});")
-            context_parts.append("")
-        
-        # Add business context
-        if self.business_context:
-            context_parts.append("BUSINESS CONTEXT:")
-            context_parts.extend(self.business_context)
-            context_parts.append("")
-        
-        # Add training examples
-        if self.training_examples:
-            context_parts.append("EXAMPLE QUERIES:")
-            for example in self.training_examples:
-                context_parts.append(f"Question: {example['question']}")
-                context_parts.append(f"SQL: {example['sql']}")
-                if example['explanation']:
-                    context_parts.append(f"Explanation: {example['explanation']}")
-                context_parts.append("")
-        
-        return "\n".join(context_parts)
+        if self._context_cache is None:
+            sections = (self._schema_ddl, self._business_ctx_str, self._examples_str)
+            self._context_cache = "\n".join(section for section in sections if section)
+        return self._context_cache
+    
+    def _prompt_prefix(self, template: str) -> str:
+        """Render a prompt template's static prefix once per context"""
+        prefix = self._prefix_cache.get(template)
+        if prefix is None:
+            prefix = self._prefix_cache[template] = template.format(context=self._build_context_prompt())
+        return prefix
+    
+    def _generate(self, prompt: str) -> str:
+        """Call Gemini, capping concurrent requests on the shared channel"""
+        # Fail fast without a network round-trip once the local quota is spent
+        if not self._limiter.try_acquire():
+            raise RuntimeError("429 Gemini request quota exhausted, try again shortly")
+        with self._semaphore:
+            response = self.model.generate_content(prompt)
+        return response.text
     
     def generate_sql(self, question: str) -> str:
         """Generate SQL from natural language question"""
-        context = self._build_context_prompt()
+        key = _question_key(question)
+        with self._sql_cache_lock:
+            cached = self._sql_cache.get(key)
+        if cached is not None:
+            return cached
         
-        prompt = f"""You are an expert SQL query generator. Convert the natural language question to SQL.
-
-{context}
-
-RULES:
-1. Generate only valid SQL queries
-2. Use the exact table and column names from the schema
-3. Return only the SQL query, no explanations
-4. Use proper SQL syntax and best practices
-5. If the question cannot be answered with the given schema, return "ERROR: Cannot generate SQL for this question"
-
-Question: {question}
-
-SQL Query:"""
+        prompt = self._prompt_prefix(_SQL_PROMPT_PREFIX) + question + _SQL_PROMPT_SUFFIX
 
         try:
-            response = self.model.generate_content(prompt)
-            sql = response.text.strip()
-            
-            # Clean up the response
-            if sql.startswith("```sql"):
-                sql = sql[6:]
-            if sql.startswith("```"):
-                sql = sql[3:]
-            if sql.endswith("```"):
-                sql = sql[:-3]
-            
-            return sql.strip()
+            sql = _FENCE_RE.sub("", self._generate(prompt).strip()).strip()
+            if sql and not sql.startswith("ERROR"):
+                with self._sql_cache_lock:
+                    self._sql_cache[key] = sql
+            return sql
         
         except Exception as e:
             return f"ERROR: Failed to generate SQL - {str(e)}"
     
+    def generate_sql_batch(self, questions: List[str]) -> List[str]:
+        """Generate SQL for several questions with a single Gemini call"""
+        results: Dict[str, str] = {}
+        pending: List[str] = []
+        with self._sql_cache_lock:
+            for question in dict.fromkeys(questions):
+                cached = self._sql_cache.get(_question_key(question))
+                if cached is not None:
+                    results[question] = cached
+                else:
+                    pending.append(question)
+        
+        if len(pending) == 1:
+            results[pending[0]] = self.generate_sql(pending[0])
+        elif pending:
+            numbered = "\n".join(f"{i}. {question}" for i, question in enumerate(pending, 1))
+            prompt = self._prompt_prefix(_BATCH_PROMPT_PREFIX) + numbered + _BATCH_PROMPT_SUFFIX
+
+            try:
+                text = _FENCE_RE.sub("", self._generate(prompt).strip())
+            except Exception as e:
+                error = f"ERROR: Failed to generate SQL - {str(e)}"
+                results.update((question, error) for question in pending)
+                return [results[question] for question in questions]
+            
+            try:
+                sqls = json.loads(text)
+            except ValueError:
+                sqls = None
+            
+            if isinstance(sqls, list) and len(sqls) == len(pending) and all(isinstance(sql, str) for sql in sqls):
+                with self._sql_cache_lock:
+                    for question, sql in zip(pending, sqls):
+                        # Elements sometimes carry their own ```sql fence inside the array
+                        sql = _FENCE_RE.sub("", sql.strip()).strip()
+                        results[question] = sql
+                        if sql and not sql.startswith("ERROR"):
+                            self._sql_cache[_question_key(question)] = sql
+            else:
+                # Malformed batch answer, fall back to one call per question
+                for question in pending:
+                    results[question] = self.generate_sql(question)
+        
+        return [results[question] for question in questions]
+    
     def explain_sql(self, sql: str) -> str:
         """Generate explanation for SQL query"""
-        context = self._build_context_prompt()
+        key = " ".join(sql.split())
+        with self._sql_cache_lock:
+            cached = self._explain_cache.get(key)
+        if cached is not None:
+            return cached
         
-        prompt = f"""Explain this SQL query in simple business terms.
-
-{context}
-
-SQL Query: {sql}
-
-Explanation:"""
+        prompt = self._prompt_prefix(_EXPLAIN_PROMPT_PREFIX) + sql + _EXPLAIN_PROMPT_SUFFIX
 
         try:
-            response = self.model.generate_content(prompt)
-            return response.text.strip()
+            explanation = self._generate(prompt).strip()
+            if explanation:
+                with self._sql_cache_lock:
+                    self._explain_cache[key] = explanation
+            return explanation
         
         except Exception as e:
             return f"ERROR: Failed to explain SQL - {str(e)}"
 
-# Global instance
-gemini_sql = GeminiTextToSQL()
-
 def train_gemini_sql():
     """Train the Gemini SQL generator with sample data"""
     print("🚀 Training Gemini Text-to-SQL...")
+    gemini_sql = GeminiTextToSQL()
     
     # Add sample schema
     sample_schema = {
@@ -4,10 +4,24 @@ Handles data sync from Convex → Supabase and SQL query execution
 """
 
 import os
+import re
 import json
+import asyncio
 import logging
-from typing import Dict, List, Any, Optional
-from supabase import create_client, Client
+from datetime import date
+from functools import lru_cache
+from types import MappingProxyType
+from urllib.parse import urlsplit
+from typing import AsyncIterator, Dict, List, Any, Mapping, NamedTuple, Optional, Sequence, Tuple, Union
+import asyncpg
+import httpx
+import orjson
+import sqlglot
+from sqlglot import exp
+from cachetools import TTLCache
+from postgrest import SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from postgrest.utils import SyncClient
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -15,25 +29,448 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env.local'))
 
 logger = logging.getLogger(__name__)
 
+# Rows fetched per round-trip when streaming results
+STREAM_PAGE_SIZE = 100
+
+# Parsed SQL ASTs kept per canonical SQL string
+SQL_PARSE_CACHE_SIZE = 1024
+
+# Short-lived cache for repeated query results
+RESULT_CACHE_MAXSIZE = 512
+RESULT_CACHE_TTL = 30  # seconds
+
+# asyncpg pool settings for the direct Postgres connection; every serverless instance
+# holds its own pool, so only a couple of connections are opened up front
+POOL_MIN_SIZE = int(os.getenv("SUPABASE_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("SUPABASE_POOL_MAX_SIZE", "50"))
+POOL_COMMAND_TIMEOUT = 60  # seconds
+POOL_MAX_INACTIVE_LIFETIME = 300  # seconds
+POOL_STATEMENT_CACHE_SIZE = 256  # prepared statements kept per connection
+TRANSACTION_POOLER_PORT = 6543  # Supavisor transaction mode
+
+# httpx connection pool for the PostgREST session
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 32
+HTTP_MAX_CONNECTIONS = 64
+HTTP_KEEPALIVE_EXPIRY = 60  # seconds
+
+# Column type tokens -> PostgreSQL types, checked in order; unmatched types become TEXT
+_PG_TYPE_MAP = (
+    ('TEXT', 'TEXT'),
+    ('VARCHAR', 'TEXT'),
+    ('REAL', 'REAL'),
+    ('FLOAT', 'REAL'),
+    ('DOUBLE', 'REAL'),
+    ('INT', 'INTEGER'),
+)
+
+_CREATE_TABLE_TMPL = "CREATE TABLE IF NOT EXISTS {name} ({columns});"
+
+_UPSERT_EMBEDDING_SQL = """
+    INSERT INTO doc_embeddings (id, text, embedding, metadata)
+    VALUES ($1, $2, $3::text::vector, $4::text::jsonb)
+    ON CONFLICT (id) DO UPDATE
+    SET text = EXCLUDED.text, embedding = EXCLUDED.embedding, metadata = EXCLUDED.metadata
+"""
+
+# Mock fixtures are built once and shared read-only across calls
+_SUPABASE_NOTE_TEMPLATE = MappingProxyType({
+    "note": "Using mock data. Create 'customers' and 'orders' tables in your Supabase dashboard to use real data",
+    "supabase_url": os.getenv("SUPABASE_URL", "not-configured"),
+})
+
+_MOCK_CONFIG_NOTE = "Configure SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env.local for real data"
+
+_MOCK_CUSTOMERS_HIGH_REVENUE = (
+    MappingProxyType({
+        "id": "cust_001",
+        "name": "John Smith",
+        "email": "john@techcorp.com",
+        "company": "TechCorp Inc",
+        "city": "San Francisco",
+        "state": "CA",
+        "revenue": 15000.00,
+        "created_at": "2023-01-15"
+    }),
+    MappingProxyType({
+        "id": "cust_002",
+        "name": "Sarah Johnson",
+        "email": "sarah@innovate.io",
+        "company": "Innovate Solutions",
+        "city": "Austin",
+        "state": "TX",
+        "revenue": 8500.00,
+        "created_at": "2023-02-20"
+    }),
+)
+
+_MOCK_CUSTOMERS_COUNT = (MappingProxyType({"count": 150}),)
+
+_MOCK_TOP_CUSTOMERS = (
+    MappingProxyType({"name": "Enterprise Corp", "company": "Enterprise Corp", "revenue": 25000.00}),
+    MappingProxyType({"name": "Big Business LLC", "company": "Big Business LLC", "revenue": 18000.00}),
+)
+
+_MOCK_ORDERS = (
+    MappingProxyType({
+        "id": "ord_001",
+        "customer_id": "cust_001",
+        "product_name": "Premium Plan",
+        "amount": 299.99,
+        "status": "completed",
+        "order_date": "2024-01-15"
+    }),
+    MappingProxyType({
+        "id": "ord_002",
+        "customer_id": "cust_002",
+        "product_name": "Basic Plan",
+        "amount": 99.99,
+        "status": "pending",
+        "order_date": "2024-01-20"
+    }),
+)
+
+# Required SQL tokens -> mock fixture, checked in order
+_MOCK_RULES = (
+    (frozenset({"customers", "revenue", "5000"}), _MOCK_CUSTOMERS_HIGH_REVENUE),
+    (frozenset({"customers", "count"}), _MOCK_CUSTOMERS_COUNT),
+    (frozenset({"customers", "top"}), _MOCK_TOP_CUSTOMERS),
+    (frozenset({"customers", "order", "by"}), _MOCK_TOP_CUSTOMERS),
+    (frozenset({"orders"}), _MOCK_ORDERS),
+)
+
+_TOKEN_RE = re.compile(r"\w+")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Tables served through PostgREST table operations; other SQL goes to the exec_sql RPC
+_REST_TABLES = frozenset({'customers', 'orders'})
+
+# Primary keys of the REST tables as created by the sample schema, until a Convex sync says otherwise
+_DEFAULT_PRIMARY_KEYS = {'customers': ('id',), 'orders': ('id',)}
+
+# SELECT clauses a table plan can express; any other clause leaves the query to the RPC
+_PLAN_ARGS = frozenset({'expressions', 'from_', 'where', 'order', 'limit', 'offset'})
+
+# SQL comparison -> PostgREST filter, and the filter to use when the column is on the right
+_PG_FILTERS = {
+    exp.EQ: ('eq', 'eq'),
+    exp.NEQ: ('neq', 'neq'),
+    exp.GT: ('gt', 'lt'),
+    exp.GTE: ('gte', 'lte'),
+    exp.LT: ('lt', 'gt'),
+    exp.LTE: ('lte', 'gte'),
+    exp.Like: ('like', None),
+    exp.ILike: ('ilike', None),
+}
+
+_UNSUPPORTED = object()
+
+class _TablePlan(NamedTuple):
+    """A single-table SELECT expressed as PostgREST table operations"""
+    table: str
+    columns: str  # PostgREST select list
+    filters: Tuple[Tuple[str, str, Any, bool], ...]  # (filter, column, value, negated)
+    order: Tuple[Tuple[str, bool, bool], ...]  # (column, desc, nulls first)
+    limit: Optional[int]
+    offset: int
+    count_key: Optional[str]  # result key when the query is a bare COUNT(*)
+
+def _canonical_sql(sql: str) -> str:
+    """Collapse whitespace so trivially different SQL shares a cache entry"""
+    return _WHITESPACE_RE.sub(" ", sql).strip()
+
+def _freeze(value: Any) -> Any:
+    """Read-only copy of decoded JSON, so cached rows can be shared by every caller"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+@lru_cache(maxsize=SQL_PARSE_CACHE_SIZE)
+def _parse_sql(sql: str) -> Optional[exp.Expression]:
+    """Parse canonical SQL once; None when sqlglot can't read it. Callers must not mutate the tree"""
+    try:
+        return sqlglot.parse_one(sql, read='postgres')
+    except sqlglot.errors.SqlglotError:
+        return None
+
+@lru_cache(maxsize=2)
+def _month_start(today: date) -> str:
+    """First day of today's month as an ISO date; keyed on the date so it rolls over on its own"""
+    return today.replace(day=1).isoformat()
+
+def _sql_value(node: exp.Expression) -> Any:
+    """Python value for a literal operand, or _UNSUPPORTED"""
+    if isinstance(node, exp.Literal):
+        return node.to_py()
+    if isinstance(node, exp.Boolean):
+        return node.this
+    if isinstance(node, (exp.TimestampTrunc, exp.DateTrunc)) and isinstance(node.this, (exp.CurrentDate, exp.CurrentTimestamp)):
+        if node.text('unit').upper() == 'MONTH':
+            return _month_start(date.today())
+    return _UNSUPPORTED
+
+def _predicate_filter(node: exp.Expression) -> Optional[Tuple[str, str, Any, bool]]:
+    """(filter, column, value, negated) for one comparison, or None when it can't be pushed down"""
+    if isinstance(node, exp.Paren):
+        return _predicate_filter(node.this)
+    if isinstance(node, exp.Not):
+        inner = _predicate_filter(node.this)
+        if inner is None:
+            return None
+        op, column, value, negated = inner
+        return op, column, value, not negated
+    
+    # IS NOT NULL, NOT LIKE and NOT ILIKE parse as the positive node with negate set
+    negated = bool(node.args.get('negate'))
+    if isinstance(node, exp.Is) and isinstance(node.this, exp.Column) and isinstance(node.expression, exp.Null):
+        return 'is_', node.this.name, 'null', negated
+    if isinstance(node, exp.In) and isinstance(node.this, exp.Column) and node.expressions:
+        values = tuple(_sql_value(value) for value in node.expressions)
+        if _UNSUPPORTED in values:
+            return None
+        return 'in_', node.this.name, values, negated
+    
+    filters = _PG_FILTERS.get(type(node))
+    if filters is None:
+        return None
+    column, operand, op = node.this, node.expression, filters[0]
+    if not isinstance(column, exp.Column):
+        column, operand, op = operand, column, filters[1]
+    if op is None or not isinstance(column, exp.Column):
+        return None
+    value = _sql_value(operand)
+    if value is _UNSUPPORTED:
+        return None
+    return op, column.name, value, negated
+
+def _plan_filters(node: exp.Expression) -> Optional[Tuple[Tuple[str, str, Any, bool], ...]]:
+    """Filters for every AND-ed conjunct of a WHERE clause, or None when any of them can't be pushed down"""
+    if isinstance(node, exp.Paren):
+        return _plan_filters(node.this)
+    if isinstance(node, exp.And):
+        left, right = _plan_filters(node.this), _plan_filters(node.expression)
+        if left is None or right is None:
+            return None
+        return left + right
+    
+    pushed = _predicate_filter(node)
+    return None if pushed is None else (pushed,)
+
+def _row_count(node: exp.Expression) -> Optional[int]:
+    """The integer of a plain LIMIT n / OFFSET n clause, else None"""
+    if not isinstance(node, (exp.Limit, exp.Offset)) or any(node.args.get(key) for key in ('this', 'expressions')):
+        return None
+    if isinstance(node.expression, exp.Literal) and node.expression.is_int:
+        return int(node.expression.this)
+    return None
+
+@lru_cache(maxsize=SQL_PARSE_CACHE_SIZE)
+def _table_plan(sql: str) -> Optional[_TablePlan]:
+    """
+    Translate canonical SQL into a PostgREST table plan, or None unless every clause translates
+    Dropping a predicate, join, grouping or projection expression would return the wrong rows,
+    so such queries are left whole for the exec_sql RPC
+    """
+    ast = _parse_sql(sql)
+    if not isinstance(ast, exp.Select) or any(value for key, value in ast.args.items() if key not in _PLAN_ARGS):
+        return None
+    source = ast.args.get('from_')
+    if source is None or not isinstance(source.this, exp.Table) or source.this.args.get('db'):
+        return None
+    table = source.this.name.lower()
+    if table not in _REST_TABLES:
+        return None
+    
+    # Columns qualified with another table can't be read from this endpoint
+    names = {table, source.this.alias_or_name.lower()}
+    for column in ast.find_all(exp.Column):
+        if column.table and column.table.lower() not in names:
+            return None
+    
+    columns, aliases, count_key = [], {}, None
+    for projection in ast.expressions:
+        alias = projection.alias if isinstance(projection, exp.Alias) else None
+        node = projection.this if alias else projection
+        if isinstance(node, exp.Star) or (isinstance(node, exp.Column) and isinstance(node.this, exp.Star)):
+            columns.append('*')
+        elif isinstance(node, exp.Column):
+            columns.append(f"{alias}:{node.name}" if alias else node.name)
+            if alias:
+                aliases[alias.lower()] = node.name
+        elif isinstance(node, exp.Count) and isinstance(node.this, (exp.Star, exp.Literal)) and len(ast.expressions) == 1:
+            count_key = alias or 'count'
+        else:
+            return None
+    
+    filters = ()
+    where = ast.args.get('where')
+    if where is not None:
+        filters = _plan_filters(where.this)
+        if filters is None:
+            return None
+    
+    order = []
+    for ordered in ast.args['order'].expressions if ast.args.get('order') else ():
+        node = ordered.this
+        if not isinstance(node, exp.Column) or isinstance(node.this, exp.Star):
+            return None
+        desc, nulls_first = bool(ordered.args.get('desc')), bool(ordered.args.get('nulls_first'))
+        # PostgREST's default matches Postgres' (NULLS FIRST only for DESC), and postgrest-py
+        # can't spell NULLS LAST, so DESC NULLS LAST doesn't translate
+        if desc and not nulls_first:
+            return None
+        # ORDER BY resolves output aliases before table columns, as Postgres does
+        name = node.name if node.table else aliases.get(node.name.lower(), node.name)
+        order.append((name, desc, nulls_first and not desc))
+    
+    limit = offset = None
+    if ast.args.get('limit') is not None:
+        limit = _row_count(ast.args['limit'])
+        if limit is None:
+            return None
+    if ast.args.get('offset') is not None:
+        offset = _row_count(ast.args['offset'])
+        if offset is None:
+            return None
+    
+    if count_key is not None:
+        # The count is a single row, which LIMIT 0 or any OFFSET would drop
+        if limit == 0 or offset:
+            return None
+        order, limit = [], None
+    
+    return _TablePlan(table, ','.join(columns) or '*', filters, tuple(order), limit, offset or 0, count_key)
+
+def _plan_size(plan: _TablePlan, max_results: int) -> int:
+    """max_results, tightened by the query's own LIMIT when it has one"""
+    return max_results if plan.limit is None else min(max_results, plan.limit)
+
+@lru_cache(maxsize=SQL_PARSE_CACHE_SIZE)
+def _split_statements(sql: str) -> Tuple[str, ...]:
+    """Split compound SQL into its statements; SQL sqlglot can't read stays whole"""
+    if ';' not in sql:
+        return (sql,)
+    try:
+        statements = [stmt for stmt in sqlglot.parse(sql, read='postgres') if stmt is not None]
+    except sqlglot.errors.SqlglotError:
+        return (sql,)
+    if len(statements) < 2:
+        return (sql,)
+    return tuple(stmt.sql(dialect='postgres') for stmt in statements)
+
+def _orjson_response_hook(response: httpx.Response) -> None:
+    """Decode PostgREST response bodies with orjson instead of stdlib json"""
+    response.json = lambda **kwargs: orjson.loads(response.content)
+
+def _statement_cache_size(db_url: str) -> int:
+    """
+    Per-connection prepared statement cache size for the asyncpg pool
+    Repeated SQL is parsed and planned once per connection, except behind the transaction
+    pooler, where consecutive statements may land on different server connections
+    """
+    try:
+        port = urlsplit(db_url).port
+    except ValueError:
+        port = None
+    return 0 if port == TRANSACTION_POOLER_PORT else POOL_STATEMENT_CACHE_SIZE
+
+class _PostgrestClient(SyncPostgrestClient):
+    """
+    PostgREST client whose session keeps a larger keep-alive pool and decodes with orjson
+    postgrest-py's default session already negotiates HTTP/2 and gzip, so only the pool
+    limits and the decode hook change; any session it rebuilds goes through here too
+    """
+    
+    def create_session(self, base_url: str, headers: Dict[str, str],
+                       timeout: Union[int, float, httpx.Timeout], verify: bool = True) -> SyncClient:
+        # orjson.JSONDecodeError subclasses json.JSONDecodeError, so postgrest-py's empty-body handling still applies
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            verify=verify,
+            follow_redirects=True,
+            http2=True,
+            limits=httpx.Limits(
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                max_connections=HTTP_MAX_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+            ),
+            event_hooks={'response': [_orjson_response_hook]},
+        )
+
+@lru_cache(maxsize=None)
+def _shared_client(url: str, key: str) -> SyncPostgrestClient:
+    """
+    Create one PostgREST client per (url, key) for the whole process
+    Only tables and RPCs are used, so the client is built directly instead of through
+    supabase-py, which replaces its PostgREST client on auth events and schema switches
+    """
+    headers = {**DEFAULT_POSTGREST_CLIENT_HEADERS, 'apiKey': key, 'Authorization': f'Bearer {key}'}
+    return _PostgrestClient(f"{url}/rest/v1", headers=headers)
+
 class SupabaseManager:
     """Manages Supabase connection and operations for text-to-query system"""
     
+    __slots__ = (
+        'url', 'anon_key', 'service_role_key', 'db_url',
+        'pool', '_pool_lock', '_result_cache', 'client', '_connected', '_primary_keys',
+    )
+    
     def __init__(self):
         self.url = os.getenv("SUPABASE_URL")
         self.anon_key = os.getenv("SUPABASE_ANON_KEY") 
         self.service_role_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
         
+        # Optional Postgres DSN; when set, SQL runs over a pooled asyncpg connection
+        self.db_url = os.getenv("SUPABASE_DB_URL")
+        self.pool: Optional[asyncpg.Pool] = None
+        self._pool_lock = asyncio.Lock()
+        self._result_cache = TTLCache(maxsize=RESULT_CACHE_MAXSIZE, ttl=RESULT_CACHE_TTL)
+        # Table -> primary key columns, used to give paged reads a total order
+        self._primary_keys: Dict[str, Tuple[str, ...]] = dict(_DEFAULT_PRIMARY_KEYS)
+        
         if not all([self.url, self.service_role_key]):
             logger.warning("Supabase credentials not found, using mock mode")
             self.client = None
         else:
             # Use service role key for backend operations
-            self.client = create_client(self.url, self.service_role_key)
+            self.client = _shared_client(self.url, self.service_role_key)
             logger.info(f"Supabase client initialized for {self.url[:30]}...")
+        
+        # Neither the client nor the DSN changes after construction
+        self._connected = self.client is not None or self.db_url is not None
     
     def is_connected(self) -> bool:
-        """Check if Supabase client is properly configured"""
-        return self.client is not None
+        """Check if Supabase client or database pool is properly configured"""
+        return self._connected
+    
+    async def connect(self) -> asyncpg.Pool:
+        """Create the asyncpg pool on first use"""
+        if self.pool is None:
+            async with self._pool_lock:
+                if self.pool is None:
+                    self.pool = await asyncpg.create_pool(
+                        self.db_url,
+                        min_size=POOL_MIN_SIZE,
+                        max_size=POOL_MAX_SIZE,
+                        command_timeout=POOL_COMMAND_TIMEOUT,
+                        max_inactive_connection_lifetime=POOL_MAX_INACTIVE_LIFETIME,
+                        statement_cache_size=_statement_cache_size(self.db_url)
+                    )
+                    logger.info("asyncpg pool initialized for Supabase Postgres")
+        return self.pool
+    
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking postgrest-py call in a worker thread"""
+        return await asyncio.to_thread(fn, *args, **kwargs)
+    
+    async def close(self):
+        """Close the asyncpg pool if one was opened"""
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
     
     async def sync_schema_from_convex(self, schema_data: Dict[str, Any]) -> bool:
         """
@@ -43,23 +480,43 @@ class SupabaseManager:
         if not self.is_connected():
             logger.warning("Supabase not connected, skipping schema sync")
             return False
+        
+        # Writes invalidate any cached query results
+        self._result_cache.clear()
             
         try:
-            # For each table in the schema, ensure it exists in Supabase
-            for table_info in schema_data.get('tables', []):
-                table_name = table_info['name']
-                columns = table_info['columns']
-                
-                # Create table if it doesn't exist (basic SQL DDL)
-                create_table_sql = self._generate_create_table_sql(table_name, columns)
-                
-                try:
-                    # Execute via RPC or direct SQL
-                    result = self.client.rpc('exec_sql', {'sql': create_table_sql}).execute()
-                    logger.info(f"Table {table_name} created/verified in Supabase")
-                except Exception as e:
-                    logger.info(f"Table {table_name} may already exist: {str(e)}")
+            tables = schema_data.get('tables', [])
+            if not tables:
+                return True
+            
+            # All CREATE TABLE statements go out in one round-trip
+            ddl = "\n".join(
+                self._generate_create_table_sql(table_info['name'], table_info['columns'])
+                for table_info in tables
+            )
+            table_names = ', '.join(table_info['name'] for table_info in tables)
+            primary_keys = {
+                table_info['name'].lower(): tuple(
+                    col['name'] for col in table_info['columns'] if 'PRIMARY KEY' in col['type'].upper()
+                )
+                for table_info in tables
+            }
+            
+            if self.db_url:
+                pool = await self.connect()
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.execute(ddl)
+                self._primary_keys.update(primary_keys)
+                logger.info(f"Tables {table_names} created/verified in Supabase")
+                return True
             
+            # PostgREST already runs each RPC in its own transaction, and exec_sql can't issue
+            # BEGIN/COMMIT itself, so the joined DDL goes out as-is. A failure rolls back every
+            # table, so it is reported below rather than treated as "already exists"
+            await self._run(self.client.rpc('exec_sql', {'sql': ddl}).execute)
+            self._primary_keys.update(primary_keys)
+            logger.info(f"Tables {table_names} created/verified in Supabase")
             return True
             
         except Exception as e:
@@ -71,62 +528,36 @@ class SupabaseManager:
         column_definitions = []
         
         for col in columns:
-            col_name = col['name']
-            col_type = col['type']
-            
-            # Map common types to PostgreSQL
-            if 'TEXT' in col_type.upper():
-                pg_type = 'TEXT'
-            elif 'REAL' in col_type.upper() or 'FLOAT' in col_type.upper():
-                pg_type = 'REAL'
-            elif 'INT' in col_type.upper():
-                pg_type = 'INTEGER'
-            else:
-                pg_type = 'TEXT'  # Default fallback
-                
-            if 'PRIMARY KEY' in col_type.upper():
-                column_definitions.append(f"{col_name} {pg_type} PRIMARY KEY")
-            else:
-                column_definitions.append(f"{col_name} {pg_type}")
+            col_type = col['type'].upper()
+            pg_type = next((pg for token, pg in _PG_TYPE_MAP if token in col_type), 'TEXT')
+            primary_key = ' PRIMARY KEY' if 'PRIMARY KEY' in col_type else ''
+            column_definitions.append(f"{col['name']} {pg_type}{primary_key}")
         
-        return f"""
-        CREATE TABLE IF NOT EXISTS {table_name} (
-            {', '.join(column_definitions)}
-        );
-        """
+        return _CREATE_TABLE_TMPL.format(name=table_name, columns=', '.join(column_definitions))
     
-    async def execute_sql_query(self, sql: str, max_results: int = 100) -> List[Dict[str, Any]]:
+    async def execute_sql_query(self, sql: str, max_results: int = 100) -> Sequence[Mapping[str, Any]]:
         """
         Execute SQL query on Supabase with real data priority
+        Identical queries within RESULT_CACHE_TTL seconds are served from memory as read-only rows
+        Rows are only read by key: PostgREST dicts, read-only mappings, or asyncpg Records on the pool path
         """
         if not self.is_connected():
             logger.warning("Supabase not connected, using mock data")
             return self._get_mock_results(sql, max_results)
         
+        # Clean the SQL query
+        sql_clean = sql.strip().rstrip(';')
+        
+        key = (_canonical_sql(sql_clean), max_results)
+        cached = self._result_cache.get(key)
+        if cached is not None:
+            logger.info(f"Serving cached result for SQL: {sql_clean[:100]}...")
+            return list(cached)
+        
         try:
             logger.info(f"Executing SQL on Supabase: {sql[:100]}...")
-            
-            # Clean the SQL query
-            sql_clean = sql.strip().rstrip(';')
-            
-            # Try direct table operations for better compatibility
-            if self._is_customers_query(sql_clean):
-                return await self._execute_customers_query(sql_clean, max_results)
-            elif self._is_orders_query(sql_clean):
-                return await self._execute_orders_query(sql_clean, max_results)
-            else:
-                # For complex queries, try RPC if available
-                try:
-                    result = self.client.rpc('exec_sql', {'sql': sql_clean}).execute()
-                    if result.data:
-                        limited_data = result.data[:max_results] if isinstance(result.data, list) else [result.data]
-                        logger.info(f"SQL executed successfully via RPC, returned {len(limited_data)} rows")
-                        return limited_data
-                except:
-                    logger.warning("RPC exec_sql not available, using table operations")
-                    
-                # Fallback to simple table query
-                return await self._execute_simple_query(sql_clean, max_results)
+            self._check_single_statement(sql_clean)
+            results = await self._dispatch(sql_clean, max_results)
             
         except Exception as e:
             logger.error(f"Failed to execute SQL on Supabase: {str(e)}")
@@ -143,94 +574,165 @@ class SupabaseManager:
                     "message": "Please try again in a moment",
                     "fallback_options": ["Try: 'show customers'", "Try: 'count orders'"]
                 }]
+        
+        # Rows are frozen rather than copied per hit; asyncpg Records are already read-only
+        results = tuple(_freeze(row) for row in results)
+        self._result_cache[key] = results
+        return list(results)
     
-    def _is_customers_query(self, sql: str) -> bool:
-        """Check if query is targeting customers table"""
-        sql_lower = sql.lower()
-        return 'customers' in sql_lower and ('select' in sql_lower or 'count' in sql_lower)
+    def split_sql(self, sql: str) -> List[str]:
+        """Split compound SQL into the single statements execute_sql_query and iter_sql_query accept"""
+        return list(_split_statements(sql.strip().rstrip(';')))
     
-    def _is_orders_query(self, sql: str) -> bool:
-        """Check if query is targeting orders table"""
-        sql_lower = sql.lower()
-        return 'orders' in sql_lower and ('select' in sql_lower or 'count' in sql_lower)
+    def _check_single_statement(self, sql_clean: str) -> None:
+        """Refuse compound SQL, which neither a cursor nor one table operation can run whole"""
+        if len(_split_statements(sql_clean)) > 1:
+            raise ValueError("Compound SQL must be split with split_sql() and run one statement at a time")
     
-    async def _execute_customers_query(self, sql: str, max_results: int) -> List[Dict[str, Any]]:
-        """Execute queries on customers table using table operations"""
-        sql_lower = sql.lower()
+    async def _dispatch(self, sql_clean: str, max_results: int) -> Sequence[Mapping[str, Any]]:
+        """Route cleaned SQL to the pool, a table operation or the RPC fallback"""
+        # Run the SQL as-is when a direct database connection is available; this also
+        # replaces the exec_sql RPC, avoiding its JSON round-trip through PostgREST
+        if self.db_url:
+            return await self._execute_pool_query(sql_clean, max_results)
+        
+        # Try direct table operations for better compatibility
+        plan = _table_plan(_canonical_sql(sql_clean))
+        if plan is not None:
+            return await self._execute_table_query(plan, max_results)
         
+        # For complex queries, try RPC if available
         try:
-            if 'count' in sql_lower:
-                # Count query
-                result = self.client.table('customers').select('*', count='exact').execute()
-                return [{"count": result.count}]
-            
-            # Build query
-            query = self.client.table('customers').select('*')
-            
-            # Handle WHERE conditions
-            if 'where' in sql_lower:
-                if 'revenue >' in sql_lower:
-                    import re
-                    match = re.search(r'revenue\s*>\s*(\d+)', sql_lower)
-                    if match:
-                        threshold = int(match.group(1))
-                        query = query.gt('revenue', threshold)
-                elif 'state' in sql_lower:
-                    match = re.search(r"state\s*=\s*['\"]([^'\"]+)['\"]", sql_lower)
-                    if match:
-                        state = match.group(1).upper()
-                        query = query.eq('state', state)
-            
-            # Handle ORDER BY
-            if 'order by' in sql_lower and 'revenue' in sql_lower:
-                if 'desc' in sql_lower:
-                    query = query.order('revenue', desc=True)
-                else:
-                    query = query.order('revenue')
-            
-            # Execute with limit
-            result = query.limit(max_results).execute()
-            
+            result = await self._run(self.client.rpc('exec_sql', {'sql': sql_clean}).execute)
             if result.data:
-                logger.info(f"Retrieved {len(result.data)} customer records from Supabase")
-                return result.data
-            else:
-                return [{"message": "No customers found", "note": "The customers table exists but is empty"}]
-                
-        except Exception as e:
-            logger.error(f"Error executing customers query: {str(e)}")
-            raise
+                limited_data = result.data[:max_results] if isinstance(result.data, list) else [result.data]
+                logger.info(f"SQL executed successfully via RPC, returned {len(limited_data)} rows")
+                return limited_data
+        except:
+            logger.warning("RPC exec_sql not available, using table operations")
+            
+        # Fallback to simple table query
+        return await self._execute_simple_query(sql_clean, max_results)
+    
+    async def _execute_pool_query(self, sql: str, max_results: int) -> List[asyncpg.Record]:
+        """
+        Execute SQL over the asyncpg pool in a read-only transaction, fetching at most max_results rows
+        Records are returned as-is; they support key access and are only turned into dicts when encoded
+        """
+        if max_results <= 0:
+            return []
+        
+        pool = await self.connect()
+        async with pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(sql)
+                rows = await cursor.fetch(max_results)
+        
+        logger.info(f"SQL executed successfully via asyncpg, returned {len(rows)} rows")
+        return rows
     
-    async def _execute_orders_query(self, sql: str, max_results: int) -> List[Dict[str, Any]]:
-        """Execute queries on orders table using table operations"""
-        sql_lower = sql.lower()
+    def _table_query(self, plan: _TablePlan):
+        """Build the PostgREST query for a plan with its filters and ordering applied"""
+        query = self.client.table(plan.table)
+        if plan.count_key is not None:
+            # Exact count transferring a single key (or row); a bare select() would send HEAD,
+            # whose empty body postgrest-py reads as count=0
+            primary_key = self._primary_keys.get(plan.table)
+            query = query.select(primary_key[0] if primary_key else '*', count='exact')
+        else:
+            query = query.select(plan.columns)
         
+        for op, column, value, negated in plan.filters:
+            if negated:
+                query = query.not_
+            query = getattr(query, op)(column, value)
+        for column, desc, nulls_first in plan.order:
+            query = query.order(column, desc=desc, nullsfirst=nulls_first)
+        return query
+    
+    async def _execute_table_query(self, plan: _TablePlan, max_results: int) -> List[Dict[str, Any]]:
+        """Execute a translated single-table query using table operations"""
         try:
-            if 'count' in sql_lower:
-                result = self.client.table('orders').select('*', count='exact').execute()
-                return [{"count": result.count}]
-            
-            query = self.client.table('orders').select('*')
+            if plan.count_key is not None:
+                result = await self._run(self._table_query(plan).limit(1).execute)
+                return [{plan.count_key: result.count}]
             
-            # Handle date filters for "this month"
-            if 'this month' in sql_lower or ('month' in sql_lower and 'current' in sql_lower):
-                from datetime import datetime, timedelta
-                today = datetime.now()
-                first_day = today.replace(day=1)
-                query = query.gte('order_date', first_day.strftime('%Y-%m-%d'))
-            
-            result = query.limit(max_results).execute()
+            size = _plan_size(plan, max_results)
+            if size <= 0:
+                return []
+            result = await self._run(self._table_query(plan).range(plan.offset, plan.offset + size - 1).execute)
             
             if result.data:
-                logger.info(f"Retrieved {len(result.data)} order records from Supabase")
+                logger.info(f"Retrieved {len(result.data)} {plan.table} records from Supabase")
                 return result.data
             else:
-                return [{"message": "No orders found", "note": "The orders table exists but is empty"}]
+                return [{"message": f"No {plan.table} found", "note": f"The {plan.table} table exists but is empty"}]
                 
         except Exception as e:
-            logger.error(f"Error executing orders query: {str(e)}")
+            logger.error(f"Error executing {plan.table} query: {str(e)}")
             raise
     
+    async def iter_sql_query(self, sql: str, max_results: int = 100,
+                             page_size: int = STREAM_PAGE_SIZE) -> AsyncIterator[Mapping[str, Any]]:
+        """
+        Yield query rows one page at a time instead of buffering the full result
+        Pool queries stream through a server-side cursor, table queries are paged with
+        range(); anything else falls back to execute_sql_query. Compound SQL raises ValueError
+        """
+        sql_clean = sql.strip().rstrip(';')
+        self._check_single_statement(sql_clean)
+        
+        if self.db_url:
+            async for row in self._iter_pool_query(sql_clean, max_results, page_size):
+                yield row
+            return
+        
+        plan = _table_plan(_canonical_sql(sql_clean)) if self.client is not None else None
+        if plan is None or plan.count_key is not None:
+            for row in await self.execute_sql_query(sql, max_results):
+                yield row
+            return
+        
+        max_results = _plan_size(plan, max_results)
+        # range() pages only line up under a total order, so the primary key breaks any ties;
+        # without a known key the rows are read in a single range instead
+        primary_key = self._primary_keys.get(plan.table, ())
+        if not primary_key:
+            page_size = max_results
+        ordered = {column for column, _, _ in plan.order}
+        tiebreak = [column for column in primary_key if column not in ordered]
+        
+        fetched = 0
+        while fetched < max_results:
+            size = min(page_size, max_results - fetched)
+            start = plan.offset + fetched
+            page = self._table_query(plan)
+            for column in tiebreak:
+                page = page.order(column)
+            page = page.range(start, start + size - 1)
+            result = await self._run(page.execute)
+            for row in result.data:
+                yield row
+            if len(result.data) < size:
+                break
+            fetched += size
+    
+    async def _iter_pool_query(self, sql: str, max_results: int,
+                               page_size: int) -> AsyncIterator[asyncpg.Record]:
+        """Stream rows from a read-only cursor, fetching page_size rows per round-trip"""
+        if max_results <= 0:
+            return
+        
+        pool = await self.connect()
+        async with pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                count = 0
+                async for row in conn.cursor(sql, prefetch=min(page_size, max_results)):
+                    yield row
+                    count += 1
+                    if count >= max_results:
+                        break
+    
     async def _execute_simple_query(self, sql: str, max_results: int) -> List[Dict[str, Any]]:
         """Fallback for simple queries"""
         return [{
@@ -240,78 +742,26 @@ class SupabaseManager:
             "suggestion": "Try simpler queries like 'show customers' or 'count orders'"
         }]
     
-    def _get_mock_results(self, sql: str, max_results: int) -> List[Dict[str, Any]]:
+    def _get_mock_results(self, sql: str, max_results: int) -> List[Mapping[str, Any]]:
         """
         Return mock results based on SQL pattern matching
         This is used when Supabase tables don't exist yet or as fallback
         """
-        sql_lower = sql.lower()
+        supabase_note = {**_SUPABASE_NOTE_TEMPLATE, "sql_generated": sql}
         
-        # Add note about Supabase setup
-        supabase_note = {
-            "note": "Using mock data. Create 'customers' and 'orders' tables in your Supabase dashboard to use real data",
-            "supabase_url": os.getenv("SUPABASE_URL", "not-configured"),
-            "sql_generated": sql
-        }
+        tokens = frozenset(_TOKEN_RE.findall(sql.lower()))
+        for required, fixture in _MOCK_RULES:
+            if required <= tokens:
+                return [*fixture[:max_results], supabase_note]
         
-        if 'customers' in sql_lower and 'revenue' in sql_lower and '5000' in sql_lower:
-            return [
-                {
-                    "id": "cust_001",
-                    "name": "John Smith",
-                    "email": "john@techcorp.com", 
-                    "company": "TechCorp Inc",
-                    "city": "San Francisco",
-                    "state": "CA",
-                    "revenue": 15000.00,
-                    "created_at": "2023-01-15"
-                },
-                {
-                    "id": "cust_002",
-                    "name": "Sarah Johnson",
-                    "email": "sarah@innovate.io", 
-                    "company": "Innovate Solutions",
-                    "city": "Austin",
-                    "state": "TX",
-                    "revenue": 8500.00,
-                    "created_at": "2023-02-20"
-                }
-            ][:max_results] + [supabase_note]
-        elif 'customers' in sql_lower and 'count' in sql_lower:
-            return [{"count": 150}, supabase_note]
-        elif 'customers' in sql_lower and ('top' in sql_lower or 'order by' in sql_lower):
-            return [
-                {"name": "Enterprise Corp", "company": "Enterprise Corp", "revenue": 25000.00},
-                {"name": "Big Business LLC", "company": "Big Business LLC", "revenue": 18000.00}
-            ][:max_results] + [supabase_note]
-        elif 'orders' in sql_lower:
-            return [
-                {
-                    "id": "ord_001",
-                    "customer_id": "cust_001",
-                    "product_name": "Premium Plan",
-                    "amount": 299.99,
-                    "status": "completed",
-                    "order_date": "2024-01-15"
-                },
-                {
-                    "id": "ord_002", 
-                    "customer_id": "cust_002",
-                    "product_name": "Basic Plan", 
-                    "amount": 99.99,
-                    "status": "pending",
-                    "order_date": "2024-01-20"
-                }
-            ][:max_results] + [supabase_note]
-        else:
-            return [
-                {
-                    "message": "Mock data from SupabaseManager",
-                    "query": sql[:100] + "..." if len(sql) > 100 else sql,
-                    "note": f"Configure SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY in .env.local for real data"
-                },
-                supabase_note
-            ][:max_results]
+        return [
+            {
+                "message": "Mock data from SupabaseManager",
+                "query": sql[:100] + "..." if len(sql) > 100 else sql,
+                "note": _MOCK_CONFIG_NOTE
+            },
+            supabase_note
+        ][:max_results]
     
     async def store_embeddings(self, doc_id: str, text: str, embedding: List[float], metadata: Dict = None):
         """
@@ -321,8 +771,20 @@ class SupabaseManager:
         if not self.is_connected():
             logger.warning("Supabase not connected, skipping embedding storage")
             return False
+        
+        # Writes invalidate any cached query results
+        self._result_cache.clear()
             
         try:
+            if self.db_url:
+                pool = await self.connect()
+                await pool.execute(
+                    _UPSERT_EMBEDDING_SQL,
+                    doc_id, text, json.dumps(embedding), json.dumps(metadata or {})
+                )
+                logger.info(f"Stored embedding for doc {doc_id}")
+                return True
+            
             # Store in embeddings table with pgvector support
             data = {
                 'id': doc_id,
@@ -331,7 +793,7 @@ class SupabaseManager:
                 'metadata': metadata or {}
             }
             
-            result = self.client.table('doc_embeddings').upsert(data).execute()
+            await self._run(self.client.table('doc_embeddings').upsert(data).execute)
             logger.info(f"Stored embedding for doc {doc_id}")
             return True
             
@@ -339,7 +801,62 @@ class SupabaseManager:
             logger.error(f"Failed to store embedding: {str(e)}, doc_id: {doc_id}")
             return False
     
-    async def search_similar_docs(self, query_embedding: List[float], limit: int = 5) -> List[Dict]:
+    async def store_embeddings_many(self, items: List[Dict[str, Any]]) -> bool:
+        """
+        Store a batch of embeddings in one round-trip
+        Each item needs id, text and embedding; metadata is optional
+        """
+        if not self.is_connected():
+            logger.warning("Supabase not connected, skipping embedding storage")
+            return False
+        
+        # Keyed on id so a repeated doc keeps its last version; a single upsert
+        # can't touch the same row twice
+        by_id: Dict[Any, Dict[str, Any]] = {}
+        for item in items:
+            if not isinstance(item, Mapping):
+                logger.error(f"Invalid embedding item of type {type(item).__name__}")
+                return False
+            if not item.get('id') or 'text' not in item or not item.get('embedding'):
+                logger.error(f"Invalid embedding item, doc_id: {item.get('id')}")
+                return False
+            by_id[item['id']] = {
+                'id': item['id'],
+                'text': item['text'],
+                'embedding': item['embedding'],
+                'metadata': item.get('metadata') or {}
+            }
+        
+        if not by_id:
+            return True
+        rows = list(by_id.values())
+        
+        # Writes invalidate any cached query results
+        self._result_cache.clear()
+        
+        try:
+            if self.db_url:
+                pool = await self.connect()
+                async with pool.acquire() as conn:
+                    async with conn.transaction():
+                        await conn.executemany(
+                            _UPSERT_EMBEDDING_SQL,
+                            [
+                                (row['id'], row['text'], json.dumps(row['embedding']), json.dumps(row['metadata']))
+                                for row in rows
+                            ]
+                        )
+            else:
+                await self._run(self.client.table('doc_embeddings').upsert(rows, on_conflict='id').execute)
+            
+            logger.info(f"Stored {len(rows)} embeddings")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Failed to store embeddings: {str(e)}, count: {len(rows)}")
+            return False
+    
+    async def search_similar_docs(self, query_embedding: List[float], limit: int = 5) -> Sequence[Mapping[str, Any]]:
         """
         Search for similar documents using pgvector similarity
         """
@@ -348,11 +865,19 @@ class SupabaseManager:
             return []
             
         try:
+            if self.db_url:
+                pool = await self.connect()
+                rows = await pool.fetch(
+                    "SELECT * FROM search_similar_docs($1::text::vector, $2)",
+                    json.dumps(query_embedding), limit
+                )
+                return rows
+            
             # Use pgvector similarity search
-            result = self.client.rpc('search_similar_docs', {
+            result = await self._run(self.client.rpc('search_similar_docs', {
                 'query_embedding': query_embedding,
                 'match_limit': limit
-            }).execute()
+            }).execute)
             
             return result.data if result.data else []
             
@@ -360,5 +885,7 @@ class SupabaseManager:
             logger.error(f"Failed to search similar docs: {str(e)}")
             return []
 
-# Global instance
-supabase_manager = SupabaseManager()
+@lru_cache(maxsize=1)
+def get_supabase_manager() -> SupabaseManager:
+    """Return the process-wide SupabaseManager, creating it on first use"""
+    return SupabaseManager()
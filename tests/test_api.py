@@ -0,0 +1,211 @@
+"""
+Tests for the FastAPI app wiring
+"""
+
+import asyncio
+import os
+import sys
+from contextlib import asynccontextmanager
+from decimal import Decimal
+from types import MappingProxyType
+
+import msgspec
+import pytest
+from asyncpg.protocol.protocol import _create_record
+from cachetools import TTLCache
+from fastapi.testclient import TestClient
+from postgrest import SyncPostgrestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import api.index as api
+import supabase_manager
+from supabase_manager import _DEFAULT_PRIMARY_KEYS, SupabaseManager
+
+
+class _Supabase:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fresh_supabase():
+    api.get_supabase.cache_clear()
+    yield
+    api.get_supabase.cache_clear()
+
+
+def test_shutdown_closes_the_manager(fresh_supabase, monkeypatch):
+    manager = _Supabase()
+    monkeypatch.setattr(supabase_manager, "get_supabase_manager", lambda: manager)
+
+    with TestClient(api.app) as client:
+        assert api.get_supabase() is manager
+        assert client.get("/health").status_code == 200
+        assert not manager.closed
+
+    assert manager.closed
+
+
+def test_shutdown_does_not_build_an_unused_manager(fresh_supabase, monkeypatch):
+    def build():
+        raise AssertionError("the manager should not be built just to close it")
+
+    monkeypatch.setattr(supabase_manager, "get_supabase_manager", build)
+
+    with TestClient(api.app) as client:
+        assert client.get("/health").status_code == 200
+
+
+def test_encoder_handles_result_row_types():
+    record = _create_record({"id": 0, "revenue": 1}, ("cust_001", Decimal("1234.50")))
+    frozen = MappingProxyType({"id": "cust_002", "tags": ("a",), "meta": MappingProxyType({"k": "v"})})
+    encoded = api._json_encoder.encode(api._ok("q", "SELECT 1", [record, frozen], 0.5))
+
+    # Decimals go out as JSON numbers, as PostgREST returns them
+    assert b'"revenue":1234.50' in encoded
+    assert msgspec.json.decode(encoded)["results"] == [
+        {"id": "cust_001", "revenue": 1234.5},
+        {"id": "cust_002", "tags": ["a"], "meta": {"k": "v"}},
+    ]
+
+
+def test_encoder_rejects_objects_that_only_look_like_mappings():
+    class _ItemsOnly:
+        def items(self):
+            return [("leak", "internals")]
+
+    with pytest.raises(NotImplementedError):
+        api._json_encoder.encode({"row": _ItemsOnly()})
+
+
+class _Cursor:
+    """asyncpg cursor factory stand-in: awaitable for fetch(), async-iterable for streaming"""
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __await__(self):
+        async def cursor():
+            return self
+        return cursor().__await__()
+
+    def __aiter__(self):
+        async def rows():
+            for row in self.rows:
+                yield row
+        return rows()
+
+    async def fetch(self, n):
+        return self.rows[:n]
+
+
+class _Conn:
+    def __init__(self, statements):
+        self.statements = statements
+
+    @asynccontextmanager
+    async def transaction(self, readonly=False):
+        yield
+
+    def cursor(self, sql, prefetch=None):
+        if ';' in sql:
+            raise AssertionError("compound SQL reached the cursor")
+        self.statements.append(sql)
+        return _Cursor([{"table": sql.split()[-1]}])
+
+
+class _Pool:
+    def __init__(self):
+        self.statements = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield _Conn(self.statements)
+
+
+class _RestClient:
+    """PostgREST stand-in returning one row per table request"""
+    def __init__(self):
+        self.postgrest = SyncPostgrestClient("http://localhost/rest/v1")
+        self.statements = []
+
+    def table(self, name):
+        client, table = self, self.postgrest.from_(name)
+
+        class _Table:
+            def select(self, *columns, **kwargs):
+                query = table.select(*columns, **kwargs)
+                query.execute = lambda: client._record(name)
+                return query
+
+        return _Table()
+
+    def _record(self, name):
+        self.statements.append(f"SELECT * FROM {name}")
+        return type("Result", (), {"data": [{"table": name}], "count": 1})()
+
+
+def _manager(path):
+    manager = SupabaseManager.__new__(SupabaseManager)
+    manager._connected = True
+    manager._result_cache = TTLCache(maxsize=8, ttl=30)
+    manager._primary_keys = dict(_DEFAULT_PRIMARY_KEYS)
+    manager._pool_lock = asyncio.Lock()
+    if path == "pool":
+        manager.db_url, manager.pool, manager.client = "postgresql://localhost/test", _Pool(), None
+    else:
+        manager.db_url, manager.pool, manager.client = None, None, _RestClient()
+    return manager
+
+
+_COMPOUND_SQL = "SELECT * FROM customers; SELECT * FROM orders;"
+
+
+@pytest.fixture(params=["pool", "rest"])
+def compound(request, monkeypatch):
+    manager = _manager(request.param)
+
+    async def load(question):
+        return _COMPOUND_SQL
+
+    monkeypatch.setattr(api, "get_supabase", lambda: manager)
+    monkeypatch.setattr(api._gemini_loader, "load", load)
+    return (manager.pool or manager.client).statements
+
+
+def test_query_runs_compound_statements_separately(compound):
+    body = TestClient(api.app).post("/query", json={"query": "customers and orders", "explain": False}).json()
+
+    assert body["success"] is True
+    assert body["results"] == [{"table": "customers"}, {"table": "orders"}]
+    assert body["row_count"] == 2
+    assert body["subqueries"] == [
+        {"sql": "SELECT * FROM customers", "row_count": 1},
+        {"sql": "SELECT * FROM orders", "row_count": 1},
+    ]
+    assert sorted(compound) == ["SELECT * FROM customers", "SELECT * FROM orders"]
+
+
+def test_stream_runs_compound_statements_in_order(compound):
+    response = TestClient(api.app).post("/query/stream", json={"query": "customers and orders"})
+    header, *lines = [msgspec.json.decode(line) for line in response.content.splitlines()]
+
+    assert header["subqueries"] == ["SELECT * FROM customers", "SELECT * FROM orders"]
+    assert lines == [{"subquery": 0}, {"table": "customers"}, {"subquery": 1}, {"table": "orders"}]
+    assert compound == ["SELECT * FROM customers", "SELECT * FROM orders"]
+
+
+def test_single_statement_has_no_subqueries(monkeypatch):
+    manager = _manager("rest")
+
+    async def load(question):
+        return "SELECT * FROM customers"
+
+    monkeypatch.setattr(api, "get_supabase", lambda: manager)
+    monkeypatch.setattr(api._gemini_loader, "load", load)
+    body = TestClient(api.app).post("/query", json={"query": "customers", "explain": False}).json()
+    assert body["results"] == [{"table": "customers"}]
+    assert "subqueries" not in body
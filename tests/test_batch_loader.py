@@ -0,0 +1,112 @@
+"""
+Tests for coalescing SQL generation into batched Gemini calls
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gemini_sql
+from api.index import SQLBatchLoader
+
+
+class _Model:
+    """Stand-in for the Gemini model that replays canned responses and records prompts"""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        text = self.responses.pop(0)
+        return type("Response", (), {"text": text})()
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(gemini_sql.genai, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(gemini_sql.genai, "GenerativeModel", lambda name: _Model([]))
+    return gemini_sql.GeminiTextToSQL()
+
+
+def test_loader_batches_concurrent_questions():
+    calls = []
+
+    def batch_fn(questions):
+        calls.append(list(questions))
+        return [f"SQL for {question}" for question in questions]
+
+    async def run():
+        loader = SQLBatchLoader(batch_fn, max_batch_size=16, batch_window=0.01)
+        return await asyncio.gather(*(loader.load(question) for question in ("a", "b", "c")))
+
+    assert asyncio.run(run()) == ["SQL for a", "SQL for b", "SQL for c"]
+    assert calls == [["a", "b", "c"]]
+
+
+def test_loader_flushes_at_max_batch_size():
+    calls = []
+
+    def batch_fn(questions):
+        calls.append(list(questions))
+        return list(questions)
+
+    async def run():
+        loader = SQLBatchLoader(batch_fn, max_batch_size=2, batch_window=0.01)
+        return await asyncio.gather(*(loader.load(question) for question in ("a", "b", "c")))
+
+    assert asyncio.run(run()) == ["a", "b", "c"]
+    assert calls == [["a", "b"], ["c"]]
+
+
+def test_loader_propagates_exception_to_every_waiter():
+    def batch_fn(questions):
+        raise RuntimeError("boom")
+
+    async def run():
+        loader = SQLBatchLoader(batch_fn, batch_window=0.01)
+        return await asyncio.gather(*(loader.load(question) for question in ("a", "b")), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert len(results) == 2
+    assert all(isinstance(result, RuntimeError) and str(result) == "boom" for result in results)
+
+
+def test_batch_strips_fences_from_each_element(gemini):
+    gemini.model = _Model([json.dumps(["```sql\nSELECT 1\n```", "SELECT 2"])])
+    assert gemini.generate_sql_batch(["one", "two"]) == ["SELECT 1", "SELECT 2"]
+    assert len(gemini.model.prompts) == 1
+
+
+def test_batch_falls_back_per_question_on_malformed_json(gemini):
+    gemini.model = _Model(["not json at all", "SELECT 1", "```sql\nSELECT 2\n```"])
+    assert gemini.generate_sql_batch(["one", "two"]) == ["SELECT 1", "SELECT 2"]
+    assert len(gemini.model.prompts) == 3
+
+
+def test_batch_falls_back_on_wrong_length(gemini):
+    gemini.model = _Model([json.dumps(["SELECT 1"]), "SELECT 1", "SELECT 2"])
+    assert gemini.generate_sql_batch(["one", "two"]) == ["SELECT 1", "SELECT 2"]
+
+
+def test_batch_reuses_cache_and_duplicates(gemini):
+    gemini.model = _Model([json.dumps(["SELECT 1", "SELECT 2"])])
+    assert gemini.generate_sql_batch(["one", "two", "one"]) == ["SELECT 1", "SELECT 2", "SELECT 1"]
+    assert gemini.generate_sql_batch(["two", "one"]) == ["SELECT 2", "SELECT 1"]
+    assert len(gemini.model.prompts) == 1
+
+
+def test_batch_reports_generation_failure_for_every_question(gemini):
+    class _Failing:
+        def generate_content(self, prompt):
+            raise RuntimeError("unavailable")
+
+    gemini.model = _Failing()
+    results = gemini.generate_sql_batch(["one", "two"])
+    assert results == ["ERROR: Failed to generate SQL - unavailable"] * 2
@@ -0,0 +1,105 @@
+"""
+Tests for batched embedding storage
+"""
+
+import asyncio
+import json
+import os
+import sys
+from contextlib import asynccontextmanager
+
+import pytest
+from cachetools import TTLCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from supabase_manager import SupabaseManager
+
+
+class _Conn:
+    def __init__(self):
+        self.batches = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def executemany(self, sql, args):
+        self.batches.append(list(args))
+
+
+class _Pool:
+    def __init__(self):
+        self.conn = _Conn()
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+
+class _Table:
+    def __init__(self, upserts):
+        self.upserts = upserts
+
+    def upsert(self, rows, on_conflict=''):
+        self.upserts.append(rows)
+        return self
+
+    def execute(self):
+        return None
+
+
+class _Client:
+    def __init__(self):
+        self.upserts = []
+
+    def table(self, name):
+        return _Table(self.upserts)
+
+
+def _manager(client=None, pool=None) -> SupabaseManager:
+    manager = SupabaseManager.__new__(SupabaseManager)
+    manager.client = client
+    manager.db_url = "postgresql://localhost/test" if pool is not None else None
+    manager.pool = pool
+    manager._pool_lock = asyncio.Lock()
+    manager._result_cache = TTLCache(maxsize=8, ttl=30)
+    manager._connected = True
+    return manager
+
+
+_ITEMS = [
+    {"id": "a", "text": "first", "embedding": [0.1]},
+    {"id": "b", "text": "second", "embedding": [0.2], "metadata": {"k": "v"}},
+    {"id": "a", "text": "first, revised", "embedding": [0.3]},
+]
+
+
+def test_rest_upsert_deduplicates_on_id():
+    client = _Client()
+    assert asyncio.run(_manager(client=client).store_embeddings_many(_ITEMS)) is True
+    assert client.upserts == [[
+        {"id": "a", "text": "first, revised", "embedding": [0.3], "metadata": {}},
+        {"id": "b", "text": "second", "embedding": [0.2], "metadata": {"k": "v"}},
+    ]]
+
+
+def test_pool_upsert_deduplicates_on_id():
+    pool = _Pool()
+    assert asyncio.run(_manager(pool=pool).store_embeddings_many(_ITEMS)) is True
+    assert pool.conn.batches == [[
+        ("a", "first, revised", json.dumps([0.3]), json.dumps({})),
+        ("b", "second", json.dumps([0.2]), json.dumps({"k": "v"})),
+    ]]
+
+
+@pytest.mark.parametrize("item", [
+    ("a", "text", [0.1]),
+    None,
+    {"id": "a", "embedding": [0.1]},
+    {"id": "a", "text": "no embedding"},
+])
+def test_invalid_items_are_rejected_before_writing(item):
+    client = _Client()
+    assert asyncio.run(_manager(client=client).store_embeddings_many([_ITEMS[0], item])) is False
+    assert client.upserts == []
@@ -0,0 +1,56 @@
+"""
+Tests for the shared PostgREST client's session settings
+"""
+
+import os
+import ssl
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import supabase_manager
+from supabase_manager import _PostgrestClient, _orjson_response_hook, _shared_client
+
+
+def _assert_tuned(session):
+    pool = session._transport._pool
+    assert _orjson_response_hook in session.event_hooks['response']
+    assert pool._max_keepalive_connections == supabase_manager.HTTP_MAX_KEEPALIVE_CONNECTIONS
+    assert pool._max_connections == supabase_manager.HTTP_MAX_CONNECTIONS
+
+
+@pytest.fixture
+def client():
+    _shared_client.cache_clear()
+    yield _shared_client("http://localhost", "service-key")
+    _shared_client.cache_clear()
+
+
+def test_shared_client_session_is_tuned(client):
+    _assert_tuned(client.session)
+    assert str(client.session.base_url) == "http://localhost/rest/v1/"
+    assert client.session.headers["apikey"] == "service-key"
+    assert client.session.headers["authorization"] == "Bearer service-key"
+
+
+def test_settings_survive_schema_switch_and_auth(client):
+    session = client.session
+    client.schema("analytics").auth("user-token")
+    assert client.session is session
+    _assert_tuned(client.session)
+    assert client.session.headers["authorization"] == "Bearer user-token"
+
+
+def test_rebuilt_session_keeps_settings(client):
+    rebuilt = client.create_session("http://localhost/rest/v1", {}, 5)
+    _assert_tuned(rebuilt)
+    rebuilt.close()
+
+
+@pytest.mark.parametrize("verify, mode", [(True, ssl.CERT_REQUIRED), (False, ssl.CERT_NONE)])
+def test_verify_is_passed_through(verify, mode):
+    session = _PostgrestClient("https://localhost/rest/v1", verify=verify).session
+    assert session._transport._pool._ssl_context.verify_mode == mode
+    session.close()
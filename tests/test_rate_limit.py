@@ -0,0 +1,102 @@
+"""
+Tests for the local Gemini quota and the keyword fallback it triggers
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import gemini_sql
+import api.index as api
+from gemini_sql import TokenBucket
+
+
+class _Clock:
+    """Manually advanced stand-in for the time module as seen by gemini_sql"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class _Model:
+    def generate_content(self, prompt):
+        raise AssertionError("the rate limiter should reject before calling Gemini")
+
+
+class _Supabase:
+    def __init__(self):
+        self.queries = []
+
+    async def execute_sql_query(self, sql, max_results):
+        self.queries.append(sql)
+        return [{"count": 3}]
+
+    def split_sql(self, sql):
+        return [sql]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    # Swap only gemini_sql's reference so the event loop keeps the real clock
+    monkeypatch.setattr(gemini_sql, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def exhausted_gemini(monkeypatch, clock):
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(gemini_sql.genai, "configure", lambda **kwargs: None)
+    monkeypatch.setattr(gemini_sql.genai, "GenerativeModel", lambda name: _Model())
+    gemini = gemini_sql.GeminiTextToSQL()
+    gemini._limiter = TokenBucket(0)
+    monkeypatch.setattr(api, "get_gemini", lambda: gemini)
+    return gemini
+
+
+def test_token_bucket_burst_reject_refill(clock):
+    bucket = TokenBucket(3, period=60.0)
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, True]
+    assert bucket.try_acquire() is False
+
+    # One token every 20 seconds
+    clock.now += 19.9
+    assert bucket.try_acquire() is False
+    clock.now += 0.1
+    assert bucket.try_acquire() is True
+    assert bucket.try_acquire() is False
+
+    # Refill never exceeds the burst capacity
+    clock.now += 3600
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+
+
+def test_quota_error_is_reported_as_generation_failure(exhausted_gemini):
+    sql = exhausted_gemini.generate_sql("How many customers do we have?")
+    assert sql.startswith("ERROR: Failed to generate SQL - 429")
+
+
+def test_quota_error_uses_keyword_fallback(exhausted_gemini):
+    sql, is_valid, used_fallback = asyncio.run(api._resolve_sql("How many customers do we have?"))
+    assert (sql, is_valid, used_fallback) == (api._COUNT_CUSTOMERS_SQL, True, True)
+
+
+def test_quota_error_does_not_fail_the_request(exhausted_gemini, monkeypatch):
+    supabase = _Supabase()
+    monkeypatch.setattr(api, "get_supabase", lambda: supabase)
+
+    response = TestClient(api.app).post("/query", json={"query": "How many customers do we have?"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["success"] is True
+    assert body["generated_sql"] == api._COUNT_CUSTOMERS_SQL
+    assert body["results"] == [{"count": 3}]
+    assert supabase.queries == [api._COUNT_CUSTOMERS_SQL]
@@ -0,0 +1,106 @@
+"""
+Tests for the short-lived query result cache
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from cachetools import TTLCache
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from supabase_manager import RESULT_CACHE_TTL, SupabaseManager
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return _Clock()
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    """SQL sent past the cache, answered with fresh mutable rows each time"""
+    calls = []
+
+    async def dispatch(self, sql, max_results):
+        calls.append((sql, max_results))
+        if 'broken' in sql:
+            raise RuntimeError("relation does not exist")
+        return [{"id": 1, "tags": ["a"], "meta": {"k": "v"}}, {"id": 2, "tags": [], "meta": {}}][:max_results]
+
+    monkeypatch.setattr(SupabaseManager, "_dispatch", dispatch)
+    return calls
+
+
+@pytest.fixture
+def manager(clock):
+    manager = SupabaseManager.__new__(SupabaseManager)
+    manager._connected = True
+    manager._result_cache = TTLCache(maxsize=8, ttl=RESULT_CACHE_TTL, timer=clock)
+    return manager
+
+
+def _query(manager, sql, max_results=10):
+    return asyncio.run(manager.execute_sql_query(sql, max_results))
+
+
+def test_repeat_query_is_served_from_cache(manager, dispatched):
+    first = _query(manager, "SELECT * FROM customers")
+    second = _query(manager, "SELECT  *\n  FROM customers;")
+    assert second == first
+    assert len(dispatched) == 1
+
+
+def test_different_query_misses(manager, dispatched):
+    _query(manager, "SELECT * FROM customers")
+    _query(manager, "SELECT * FROM orders")
+    assert [sql for sql, _ in dispatched] == ["SELECT * FROM customers", "SELECT * FROM orders"]
+
+
+def test_max_results_is_part_of_the_key(manager, dispatched):
+    assert len(_query(manager, "SELECT * FROM customers", 1)) == 1
+    assert len(_query(manager, "SELECT * FROM customers", 2)) == 2
+    assert dispatched == [("SELECT * FROM customers", 1), ("SELECT * FROM customers", 2)]
+
+
+def test_entries_expire_after_ttl(manager, dispatched, clock):
+    _query(manager, "SELECT * FROM customers")
+    clock.now += RESULT_CACHE_TTL - 1
+    _query(manager, "SELECT * FROM customers")
+    assert len(dispatched) == 1
+
+    clock.now += 1
+    _query(manager, "SELECT * FROM customers")
+    assert len(dispatched) == 2
+
+
+def test_errors_are_not_cached(manager, dispatched):
+    assert "error" in _query(manager, "SELECT * FROM broken")[0]
+    assert "error" in _query(manager, "SELECT * FROM broken")[0]
+    assert len(dispatched) == 2
+
+
+def test_callers_cannot_corrupt_cached_rows(manager, dispatched):
+    rows = _query(manager, "SELECT * FROM customers")
+    with pytest.raises(TypeError):
+        rows[0]["id"] = 99
+    with pytest.raises(AttributeError):
+        rows[0]["tags"].append("b")
+    with pytest.raises(TypeError):
+        rows[0]["meta"]["k"] = "changed"
+    rows.clear()
+
+    cached = _query(manager, "SELECT * FROM customers")
+    assert cached[0] == {"id": 1, "tags": ("a",), "meta": {"k": "v"}}
+    assert len(cached) == 2
+    assert len(dispatched) == 1
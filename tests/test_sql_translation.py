@@ -0,0 +1,233 @@
+"""
+Tests for translating generated SQL into PostgREST filters
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from postgrest import SyncPostgrestClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from cachetools import TTLCache
+
+from supabase_manager import _DEFAULT_PRIMARY_KEYS, SupabaseManager, _table_plan
+
+
+class _Result:
+    def __init__(self, data=None, count=None):
+        self.data = data
+        self.count = count
+
+
+class _Client:
+    """Stand-in for the PostgREST client that records each request instead of sending it"""
+    def __init__(self):
+        self.postgrest = SyncPostgrestClient("http://localhost/rest/v1")
+        self.requests = []
+
+    def table(self, name):
+        client, table = self, self.postgrest.from_(name)
+
+        class _Table:
+            def select(self, *columns, **kwargs):
+                query = table.select(*columns, **kwargs)
+                query.execute = lambda: client._record(('table', name, dict(query.params)))
+                return query
+
+        return _Table()
+
+    def rpc(self, fn, params):
+        class _Rpc:
+            execute = lambda _: self._record(('rpc', fn, params))
+        return _Rpc()
+
+    def _record(self, request):
+        self.requests.append(request)
+        if request[0] == 'rpc':
+            return _Result([{"via": "rpc"}])
+        # Full pages, so streaming keeps paging
+        rows = int(request[2].get('limit', 1))
+        return _Result([{"id": i} for i in range(rows)], count=rows)
+
+
+@pytest.fixture
+def manager():
+    manager = SupabaseManager.__new__(SupabaseManager)
+    manager.client = _Client()
+    manager.db_url = None
+    manager._connected = True
+    manager._result_cache = TTLCache(maxsize=8, ttl=30)
+    manager._primary_keys = dict(_DEFAULT_PRIMARY_KEYS)
+    return manager
+
+
+def _params(manager, sql) -> dict:
+    plan = _table_plan(sql)
+    assert plan is not None, sql
+    return dict(manager._table_query(plan).params)
+
+
+@pytest.mark.parametrize("where, column, expected", [
+    ("email IS NULL", "email", "is.null"),
+    ("email IS NOT NULL", "email", "not.is.null"),
+    ("name LIKE 'A%'", "name", "like.A%"),
+    ("name NOT LIKE 'A%'", "name", "not.like.A%"),
+    ("name ILIKE 'a%'", "name", "ilike.a%"),
+    ("name NOT ILIKE 'a%'", "name", "not.ilike.a%"),
+    ("state IN ('CA', 'TX')", "state", "in.(CA,TX)"),
+    ("state NOT IN ('CA', 'TX')", "state", "not.in.(CA,TX)"),
+    ("NOT (revenue > 5000)", "revenue", "not.gt.5000"),
+])
+def test_negated_predicates(manager, where, column, expected):
+    assert _params(manager, f"SELECT * FROM customers WHERE {where}")[column] == expected
+
+
+def test_count_respects_negation(manager):
+    plan = _table_plan("SELECT COUNT(*) FROM customers WHERE email IS NOT NULL")
+    assert plan.count_key == "count"
+    assert dict(manager._table_query(plan).params) == {"select": "id", "email": "not.is.null"}
+
+
+@pytest.mark.parametrize("sql", [
+    # Would silently drop a predicate
+    "SELECT * FROM customers WHERE revenue > 5000 OR state = 'CA'",
+    "SELECT * FROM customers WHERE revenue > 5000 AND (state = 'CA' OR state = 'TX')",
+    "SELECT * FROM customers WHERE upper(name) = 'ACME'",
+    "SELECT * FROM customers WHERE NOT (revenue > 5000 AND state = 'CA')",
+    "SELECT * FROM customers WHERE revenue > (SELECT avg(revenue) FROM customers)",
+    # Touch another table
+    "SELECT c.* FROM customers c JOIN orders o ON o.customer_id = c.id WHERE o.amount > 100",
+    "SELECT * FROM customers, orders WHERE amount > 100 ORDER BY amount",
+    "SELECT * FROM customers WHERE orders.status = 'completed'",
+    "SELECT * FROM orders WHERE customer_id IN (SELECT id FROM customers WHERE revenue > 5000)",
+    "SELECT * FROM products",
+    # Clauses PostgREST can't express here
+    "SELECT DISTINCT state FROM customers",
+    "SELECT state, COUNT(*) FROM customers GROUP BY state",
+    "SELECT upper(name) FROM customers",
+    "SELECT COUNT(DISTINCT state) FROM customers",
+    "SELECT * FROM customers ORDER BY 2",
+    "SELECT * FROM customers ORDER BY revenue * 2",
+    "SELECT * FROM customers ORDER BY revenue DESC NULLS LAST",
+    "SELECT * FROM customers LIMIT ALL",
+    "SELECT COUNT(*) FROM customers OFFSET 5",
+    "WITH big AS (SELECT * FROM customers) SELECT * FROM big",
+])
+def test_untranslatable_queries_have_no_plan(sql):
+    assert _table_plan(sql) is None
+
+
+def test_untranslatable_query_goes_to_rpc(manager):
+    sql = "SELECT * FROM customers WHERE revenue > 5000 OR state = 'CA'"
+    assert asyncio.run(manager._dispatch(sql, 10)) == [{"via": "rpc"}]
+    assert manager.client.requests == [('rpc', 'exec_sql', {'sql': sql})]
+
+
+def test_alias_qualified_columns_are_translated(manager):
+    params = _params(manager, "SELECT * FROM customers c WHERE c.revenue > 5000 ORDER BY c.revenue DESC")
+    assert params == {"select": "*", "revenue": "gt.5000", "order": "revenue.desc"}
+
+
+@pytest.mark.parametrize("order_by, expected", [
+    ("r DESC", "revenue.desc"),
+    ("R", "revenue"),
+    ("c.r", "r"),
+    ("name NULLS FIRST", "name.nullsfirst"),
+    ("name DESC NULLS FIRST", "name.desc"),
+])
+def test_order_by(manager, order_by, expected):
+    params = _params(manager, f"SELECT name, revenue AS r FROM customers c ORDER BY {order_by}")
+    assert params["order"] == expected
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT name, revenue AS rev FROM customers", "name,rev:revenue"),
+    ("SELECT c.name FROM customers c", "name"),
+    ("SELECT c.* FROM customers c", "*"),
+])
+def test_projection(manager, sql, expected):
+    assert _params(manager, sql)["select"] == expected
+
+
+@pytest.mark.parametrize("sql, max_results, expected", [
+    ("SELECT * FROM customers", 10, {"offset": "0", "limit": "10"}),
+    ("SELECT * FROM customers LIMIT 5", 10, {"offset": "0", "limit": "5"}),
+    ("SELECT * FROM customers LIMIT 5 OFFSET 20", 10, {"offset": "20", "limit": "5"}),
+    ("SELECT * FROM customers LIMIT 50 OFFSET 20", 10, {"offset": "20", "limit": "10"}),
+    ("SELECT * FROM customers OFFSET 20", 10, {"offset": "20", "limit": "10"}),
+])
+def test_limit_and_offset(manager, sql, max_results, expected):
+    asyncio.run(manager._dispatch(sql, max_results))
+    (kind, table, params), = manager.client.requests
+    assert (kind, table) == ('table', 'customers')
+    assert {key: params[key] for key in ("offset", "limit")} == expected
+
+
+def test_limit_zero_skips_the_request(manager):
+    assert asyncio.run(manager._dispatch("SELECT * FROM customers LIMIT 0", 10)) == []
+    assert manager.client.requests == []
+
+
+def test_count_uses_alias(manager):
+    assert asyncio.run(manager._dispatch("SELECT COUNT(*) AS total FROM orders", 10)) == [{"total": 1}]
+    assert manager.client.requests == [('table', 'orders', {"select": "id", "limit": "1"})]
+
+
+def _stream(manager, sql, max_results, page_size):
+    async def collect():
+        return [row async for row in manager.iter_sql_query(sql, max_results, page_size=page_size)]
+    return asyncio.run(collect())
+
+
+def test_stream_pages_start_at_offset(manager):
+    _stream(manager, "SELECT * FROM customers LIMIT 3 OFFSET 7", 10, page_size=2)
+    pages = [(params["offset"], params["limit"]) for _, _, params in manager.client.requests]
+    assert pages == [("7", "2"), ("9", "1")]
+
+
+def test_stream_breaks_ties_on_primary_key(manager):
+    _stream(manager, "SELECT * FROM customers ORDER BY revenue DESC", 4, page_size=2)
+    assert [params["order"] for _, _, params in manager.client.requests] == ["revenue.desc,id"] * 2
+
+
+def test_stream_reads_one_range_without_a_known_key(manager):
+    manager._primary_keys['customers'] = ()
+    _stream(manager, "SELECT * FROM customers", 5, page_size=2)
+    (_, _, params), = manager.client.requests
+    assert "order" not in params
+    assert (params["offset"], params["limit"]) == ("0", "5")
+
+
+def test_schema_sync_records_primary_keys(manager):
+    schema = {"tables": [
+        {"name": "Customers", "columns": [{"name": "customer_key", "type": "text primary key"}, {"name": "name", "type": "text"}]},
+        {"name": "orders", "columns": [{"name": "amount", "type": "real"}]},
+    ]}
+    assert asyncio.run(manager.sync_schema_from_convex(schema)) is True
+    assert manager._primary_keys == {'customers': ('customer_key',), 'orders': ()}
+
+    asyncio.run(manager._dispatch("SELECT COUNT(*) FROM orders", 10))
+    _stream(manager, "SELECT * FROM customers", 4, page_size=2)
+    count, *pages = [params for kind, _, params in manager.client.requests if kind == 'table']
+    assert count["select"] == "*"
+    assert [params["order"] for params in pages] == ["customer_key"] * 2
+
+
+def test_split_sql(manager):
+    assert manager.split_sql("SELECT * FROM customers; SELECT COUNT(*) FROM orders;") == [
+        "SELECT * FROM customers", "SELECT COUNT(*) FROM orders",
+    ]
+    assert manager.split_sql("SELECT * FROM customers;") == ["SELECT * FROM customers"]
+
+
+def test_compound_sql_is_refused(manager):
+    sql = "SELECT * FROM customers; SELECT * FROM orders"
+    (row,) = asyncio.run(manager.execute_sql_query(sql, 10))
+    assert "split_sql" in row["error"]
+    with pytest.raises(ValueError):
+        _stream(manager, sql, 10, page_size=2)
+    assert manager.client.requests == []
+    assert len(manager._result_cache) == 0